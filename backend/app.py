@@ -2,14 +2,27 @@ from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from config import config
 from models.database import db, init_db
-from models import User
+from models import User, send_stats
+from models.migrations import run_migrations
 from routes.auth import auth_bp, init_default_user
 from routes.config import config_bp
 from routes.template import template_bp
 from routes.sender import sender_bp
 from routes.records import records_bp
 from routes.monitor import monitor_bp
+from commands import register_commands
 from utils import setup_logging
+from utils.smtp_pool import smtp_pool
+from utils.rate_limit import relay_limiters
+from utils.circuit_breaker import circuit_breakers
+from utils.send_queue import send_queue, retry_scheduler
+from utils.markdown_cache import markdown_renderer
+from utils.smtp_settings import smtp_settings
+from utils.retention import retention_job
+from utils.bulk_retry import bulk_retry
+from utils.metrics import metrics
+from utils.system_sampler import system_sampler
+from utils.db_log_handler import db_log_handler
 import os
 import logging
 from datetime import datetime
@@ -31,6 +44,24 @@ db.init_app(app)
 # 设置日志
 logger = setup_logging(app)
 
+# 配置SMTP连接池
+smtp_pool.configure(
+    max_size=app.config['SMTP_POOL_SIZE'],
+    idle_timeout=app.config['SMTP_POOL_IDLE_TIMEOUT'],
+    check_interval=app.config['SMTP_POOL_CHECK_INTERVAL'],
+    acquire_timeout=app.config['SMTP_POOL_ACQUIRE_TIMEOUT']
+)
+relay_limiters.configure(timeout=app.config['RELAY_ACQUIRE_TIMEOUT'])
+circuit_breakers.configure(
+    failure_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+    reset_timeout=app.config['CIRCUIT_RESET_TIMEOUT']
+)
+markdown_renderer.configure(max_size=app.config['MARKDOWN_CACHE_SIZE'])
+smtp_settings.configure(ttl=app.config['SMTP_SETTINGS_TTL'])
+
+# 请求和数据库耗时指标
+metrics.init_app(app)
+
 # 注册蓝图
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(config_bp, url_prefix='/api/config')
@@ -39,15 +70,36 @@ app.register_blueprint(sender_bp, url_prefix='/api/sender')
 app.register_blueprint(records_bp, url_prefix='/api/records')
 app.register_blueprint(monitor_bp, url_prefix='/api/monitor')
 
+# 注册维护命令
+register_commands(app)
+
 # 应用上下文
 with app.app_context():
     try:
         db.create_all()
+        run_migrations(db.engine)
+        send_stats.backfill_if_empty(db.session)
         init_default_user()
         logger.info('Database initialized successfully')
     except Exception as e:
         logger.error(f'Error initializing database: {str(e)}')
 
+# WARNING 及以上日志批量写入 system_logs（需在建表之后）
+db_log_handler.init_app(app)
+
+# 启动发送队列
+send_queue.init_app(app)
+retry_scheduler.init_app(app)
+
+# 批量重试任务
+bulk_retry.init_app(app)
+
+# 后台采样系统状态
+system_sampler.init_app(app)
+
+# 定时归档（RETENTION_INTERVAL > 0 时）
+retention_job.init_app(app)
+
 
 # ============ 主页路由 ============
 @app.route('/')
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Compare full ORM entity loading with summary-column selects for record lists.
+
+Usage (from the backend directory):
+    python benchmarks/list_columns_bench.py --rows 100000 --body-kb 50
+    python benchmarks/list_columns_bench.py --db /tmp/bodies.db --rows 100000 --body-kb 50
+
+Every page of the table is read through keyset pagination twice: once
+loading SendRecord entities (the old list_records behaviour) and once
+selecting only the columns the list renders. Reports wall time and the
+peak Python memory of a single page.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db_path, rows, body_kb, batch=2000):
+    """Insert rows records with body_kb KB bodies and variables"""
+    conn = sqlite3.connect(db_path)
+    existing = conn.execute('SELECT COUNT(*) FROM send_records').fetchone()[0]
+    if existing >= rows:
+        conn.close()
+        return existing
+
+    body = ('lorem ipsum dolor sit amet ' * (body_kb * 1024 // 27 + 1))[:body_kb * 1024]
+    variables = '{"payload": "' + 'x' * 1024 + '"}'
+    now = datetime.utcnow()
+
+    for start in range(existing, rows, batch):
+        params = [(
+            f'["user{i}@example.com"]',
+            f'Notification #{i}',
+            body,
+            'success',
+            'web',
+            variables,
+            (now - timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        ) for i in range(start, min(start + batch, rows))]
+        conn.executemany(
+            'INSERT INTO send_records (recipients, subject, content, status, trigger_source, '
+            'variables_used, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            params
+        )
+        conn.commit()
+
+    conn.close()
+    return rows
+
+
+def scan(make_query, per_page, session):
+    """Walk every page; returns (seconds, peak bytes for one page, pages)"""
+    from models.models import SendRecord
+    from routes.records import record_summary
+    from utils.pagination import keyset_page
+
+    cursor = ''
+    pages = 0
+    peak = 0
+    started = time.perf_counter()
+
+    while cursor is not None:
+        tracemalloc.start()
+        rows, cursor = keyset_page(make_query(), SendRecord, cursor, per_page)
+        summaries = [record_summary(r) for r in rows]
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del rows, summaries
+        session.expunge_all()
+        pages += 1
+
+    return time.perf_counter() - started, peak, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Entity vs column list benchmark')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of records to seed')
+    parser.add_argument('--body-kb', type=int, default=50, help='Size of each content body in KB')
+    parser.add_argument('--per-page', type=int, default=100, help='Rows per page')
+    parser.add_argument('--db', help='SQLite file to use (default: temporary file)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='qn-bench-')
+    db_path = os.path.abspath(args.db or os.path.join(workdir, 'bench.db'))
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SEND_WORKERS'] = '0'
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+
+    from app import app
+    from models.database import db
+    from models.models import SendRecord
+    from routes.records import SUMMARY_COLUMNS
+
+    print(f'Seeding {args.rows} records with {args.body_kb}KB bodies into {db_path}')
+    seed(db_path, args.rows, args.body_kb)
+
+    approaches = [
+        ('ORM entities', lambda: SendRecord.query),
+        ('summary columns', lambda: SendRecord.query.with_entities(*SUMMARY_COLUMNS)),
+    ]
+
+    print()
+    print(f'{"approach":<18}{"total (s)":>12}{"ms/page":>12}{"peak KB/page":>15}')
+    print('-' * 57)
+    with app.app_context():
+        for name, make_query in approaches:
+            seconds, peak, pages = scan(make_query, args.per_page, db.session)
+            print(f'{name:<18}{seconds:>12.2f}{seconds / pages * 1000:>12.2f}{peak / 1024:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
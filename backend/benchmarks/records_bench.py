@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark /api/records list and stats latency on a large send_records table.
+
+Usage (from the backend directory):
+    python benchmarks/records_bench.py --rows 1000000
+    python benchmarks/records_bench.py --db /tmp/bench.db --rows 1000000 --repeat 5
+
+The database is seeded once (re-running with the same --db reuses it). Each
+endpoint is timed with the send_records indexes dropped and then recreated.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ('list page 1', '/api/records/?page=1&per_page=20'),
+    ('list status=failed', '/api/records/?page=1&per_page=20&status=failed'),
+    ('list last 7 days', '/api/records/?page=1&per_page=20&start_date={week_ago}'),
+    ('list page 500', '/api/records/?page=500&per_page=20'),
+    ('stats', '/api/records/stats?fresh=1'),
+    ('daily stats 30d', '/api/monitor/stats/daily?days=30'),
+]
+
+
+def seed(db_path, rows, batch=50000):
+    """Insert rows synthetic send records spread over the last year"""
+    conn = sqlite3.connect(db_path)
+    existing = conn.execute('SELECT COUNT(*) FROM send_records').fetchone()[0]
+    if existing >= rows:
+        conn.close()
+        return existing
+
+    statuses = ['success'] * 9 + ['failed']
+    sources = ['web', 'batch', 'cli', 'api']
+    templates = [None] + [f'template-{i}' for i in range(20)]
+    now = datetime.utcnow()
+
+    for start in range(existing, rows, batch):
+        params = []
+        for i in range(start, min(start + batch, rows)):
+            created = now - timedelta(seconds=random.randint(0, 365 * 86400))
+            params.append((
+                random.choice(templates),
+                f'["user{i}@example.com"]',
+                f'Notification #{i}',
+                'Body of notification',
+                random.choice(statuses),
+                random.choice(sources),
+                created.strftime('%Y-%m-%d %H:%M:%S.%f')
+            ))
+        conn.executemany(
+            'INSERT INTO send_records (template_name, recipients, subject, content, status, '
+            'trigger_source, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            params
+        )
+        conn.commit()
+        print(f'  seeded {min(start + batch, rows)} / {rows}', flush=True)
+
+    conn.close()
+    return rows
+
+
+def time_endpoints(client, repeat):
+    week_ago = (datetime.utcnow() - timedelta(days=7)).strftime('%Y-%m-%d')
+    results = {}
+    for name, url in ENDPOINTS:
+        url = url.format(week_ago=week_ago)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, (url, response.status_code)
+        results[name] = sorted(timings)[len(timings) // 2]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='send_records list/stats benchmark')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of records to seed')
+    parser.add_argument('--db', help='SQLite file to use (default: temporary file)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per endpoint (median reported)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='qn-bench-')
+    db_path = os.path.abspath(args.db or os.path.join(workdir, 'bench.db'))
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SEND_WORKERS'] = '0'
+    os.environ['STATS_CACHE_TTL'] = '0'
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+
+    from app import app
+    from models.database import db
+    from models.models import SendRecord
+    from models import send_stats
+
+    print(f'Seeding {args.rows} records into {db_path}')
+    seed(db_path, args.rows)
+
+    with app.app_context():
+        send_stats.backfill(db.session)
+
+    client = app.test_client()
+    client.post('/api/auth/login', json={
+        'username': os.environ.get('INIT_USER', 'admin'),
+        'password': os.environ.get('INIT_PWD', '123456')
+    })
+
+    with app.app_context():
+        for index in SendRecord.__table__.indexes:
+            index.drop(db.engine, checkfirst=True)
+    print('Timing without indexes...')
+    without = time_endpoints(client, args.repeat)
+
+    with app.app_context():
+        for index in SendRecord.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+    print('Timing with indexes...')
+    with_idx = time_endpoints(client, args.repeat)
+
+    print()
+    print(f'{"endpoint":<22}{"no index (ms)":>16}{"indexed (ms)":>16}')
+    print('-' * 54)
+    for name, _ in ENDPOINTS:
+        print(f'{name:<22}{without[name]:>16.1f}{with_idx[name]:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
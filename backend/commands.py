@@ -0,0 +1,33 @@
+import click
+from flask import current_app
+from models.database import db
+from models import send_stats
+from models.migrations import run_migrations
+from utils.retention import run_retention
+
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI (flask --app app <command>)"""
+
+    @app.cli.command('stats-backfill')
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='Only rebuild days from this date on (keeps counts of archived records before it)')
+    def stats_backfill(since):
+        """Rebuild the send_stats_daily rollup from send_records"""
+        rows = send_stats.backfill(db.session, since=since.date() if since else None)
+        click.echo(f'send_stats_daily rebuilt: {rows} rows')
+
+    @app.cli.command('db-migrate')
+    def db_migrate():
+        """Apply pending schema migrations"""
+        applied = run_migrations(db.engine)
+        click.echo(f'Applied migrations: {applied}' if applied else 'Schema is up to date')
+
+    @app.cli.command('retention')
+    def retention():
+        """Archive and delete records past RECORD_RETENTION_* / LOG_RETENTION_DAYS"""
+        summary = run_retention(current_app.config)
+        click.echo(
+            f"Archived {summary['send_records']} send records and "
+            f"{summary['system_logs']} system logs to {current_app.config['ARCHIVE_DIR']}"
+        )
\ No newline at end of file
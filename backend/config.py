@@ -9,6 +9,76 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)
     SESSION_COOKIE_HTTPONLY = True
     JSON_SORT_KEYS = False
+    
+    # SMTP连接池
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+    SMTP_POOL_IDLE_TIMEOUT = int(os.environ.get('SMTP_POOL_IDLE_TIMEOUT', 60))
+    SMTP_POOL_CHECK_INTERVAL = int(os.environ.get('SMTP_POOL_CHECK_INTERVAL', 15))
+    # 连接数已满时等待空闲连接的最长秒数
+    SMTP_POOL_ACQUIRE_TIMEOUT = int(os.environ.get('SMTP_POOL_ACQUIRE_TIMEOUT', 30))
+    
+    # 等待中继速率/并发名额的最长秒数，超时按临时错误稍后重试
+    RELAY_ACQUIRE_TIMEOUT = int(os.environ.get('RELAY_ACQUIRE_TIMEOUT', 60))
+    
+    # 中继熔断：连续中继级失败（连接失败、断开、连接或 MAIL 阶段 4xx）次数阈值、熔断后多少秒放行一次试探发送
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+    
+    # 已解密SMTP配置的缓存秒数（多进程部署时其他进程的最大滞后，0 表示只在保存时刷新）
+    SMTP_SETTINGS_TTL = int(os.environ.get('SMTP_SETTINGS_TTL', 60))
+    
+    # 日志：级别、文件格式（text 或 json）、队列容量（满时丢弃而不阻塞请求）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # 同一处日志调用每秒最多记录的条数（0 表示不限制），只作用于 LOG_RATE_LIMIT_LEVEL 及以下级别
+    LOG_RATE_LIMIT = int(os.environ.get('LOG_RATE_LIMIT', 20))
+    LOG_RATE_LIMIT_LEVEL = os.environ.get('LOG_RATE_LIMIT_LEVEL', 'DEBUG').upper()
+    
+    # WARNING 及以上日志批量写入 system_logs（OFF 表示关闭）：每批条数、最长间隔秒数
+    LOG_DB_LEVEL = os.environ.get('LOG_DB_LEVEL', 'WARNING').upper()
+    LOG_DB_BATCH_SIZE = int(os.environ.get('LOG_DB_BATCH_SIZE', 100))
+    LOG_DB_FLUSH_INTERVAL = float(os.environ.get('LOG_DB_FLUSH_INTERVAL', 2))
+    
+    # 发送队列（0 表示在请求线程中同步发送）
+    SEND_WORKERS = int(os.environ.get('SEND_WORKERS', 4))
+    # 发送租约秒数：处于 sending 状态超过该时间的记录视为发送进程已退出，重新放回队列
+    # （按中继超时估算的最长发送时间更长时，租约取后者）
+    SEND_LEASE_TIMEOUT = int(os.environ.get('SEND_LEASE_TIMEOUT', 300))
+    
+    # Markdown渲染缓存条目数
+    MARKDOWN_CACHE_SIZE = int(os.environ.get('MARKDOWN_CACHE_SIZE', 512))
+    
+    # 统计接口结果缓存秒数（0 表示不缓存）
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 5))
+    
+    # 临时错误自动重试（次数取 SMTP 配置的 retry_times）：退避基数/上限秒数、调度轮询间隔（0 表示关闭）
+    RETRY_BACKOFF_BASE = int(os.environ.get('RETRY_BACKOFF_BASE', 30))
+    RETRY_BACKOFF_MAX = int(os.environ.get('RETRY_BACKOFF_MAX', 3600))
+    RETRY_POLL_INTERVAL = int(os.environ.get('RETRY_POLL_INTERVAL', 10))
+    
+    # 批量重试：每秒发送数（0 表示不限速）、每批提交条数、单次最多记录数
+    RETRY_RATE = float(os.environ.get('RETRY_RATE', 10))
+    RETRY_BATCH_SIZE = int(os.environ.get('RETRY_BATCH_SIZE', 100))
+    RETRY_MAX_RECORDS = int(os.environ.get('RETRY_MAX_RECORDS', 10000))
+    
+    # 系统状态采样间隔秒数（0 表示每次请求时采样）、保留的历史样本数
+    STATUS_SAMPLE_INTERVAL = int(os.environ.get('STATUS_SAMPLE_INTERVAL', 5))
+    STATUS_HISTORY_SIZE = int(os.environ.get('STATUS_HISTORY_SIZE', 120))
+    
+    # /api/monitor/metrics 的 Bearer 令牌；未配置时需登录会话
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # 设为 true 时无需认证即可抓取（仅限可信内网）
+    METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'false').lower() in ('1', 'true', 'yes')
+    
+    # 数据保留（0 表示不限制），超出的行归档到 ARCHIVE_DIR 后删除
+    RECORD_RETENTION_DAYS = int(os.environ.get('RECORD_RETENTION_DAYS', 0))
+    RECORD_RETENTION_MAX = int(os.environ.get('RECORD_RETENTION_MAX', 0))
+    LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 0))
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 1000))
+    # 后台归档间隔秒数（0 表示只通过 flask retention 命令运行）
+    RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL', 0))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -1,5 +1,6 @@
 from .database import db, init_db
-from .models import User, SMTPConfig, EmailTemplate, SendRecord, SystemLog
+from .models import User, SMTPConfig, EmailTemplate, SendRecord, SendStatsDaily, SystemLog
+from . import send_stats  # noqa: F401  注册 send_stats_daily 汇总表的 flush 监听器
 
 __all__ = [
     'db',
@@ -8,5 +9,6 @@ __all__ = [
     'SMTPConfig',
     'EmailTemplate',
     'SendRecord',
+    'SendStatsDaily',
     'SystemLog'
 ]
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""Lightweight schema migrations for databases created by db.create_all()
+
+create_all() only creates missing tables, so indexes and columns added to
+existing tables are applied here. Each migration runs once, in version
+order, and is recorded in the schema_version table. Migrations must be
+idempotent because a fresh database already has the full schema.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models.database import db
+from models.models import SendRecord, SystemLog
+from models import record_search
+
+logger = logging.getLogger(__name__)
+
+schema_version = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(255)),
+    db.Column('applied_at', db.DateTime, default=datetime.utcnow)
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register fn(connection) as schema migration number version"""
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def create_indexes(connection, table, names=None):
+    """Create indexes declared on table (only those in names, if given) that do not exist yet"""
+    for index in table.indexes:
+        if names is None or index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def add_column(connection, table_name, column_name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    columns = {c['name'] for c in inspect(connection).get_columns(table_name)}
+    if column_name not in columns:
+        connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}'))
+
+
+def applied_versions(engine):
+    with engine.connect() as connection:
+        return {row.version for row in connection.execute(schema_version.select())}
+
+
+def run_migrations(engine):
+    """Apply all pending migrations, returning the versions applied"""
+    schema_version.create(engine, checkfirst=True)
+    done = applied_versions(engine)
+    applied = []
+
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            fn(connection)
+            connection.execute(schema_version.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        logger.info(f'Applied migration {version}: {description}')
+        applied.append(version)
+
+    return applied
+
+
+@migration(1, 'Add send_records indexes')
+def add_send_records_indexes(connection):
+    create_indexes(connection, SendRecord.__table__, names=(
+        'ix_send_records_created_at',
+        'ix_send_records_status_created_at',
+        'ix_send_records_trigger_source_created_at',
+        'ix_send_records_template_name',
+    ))
+
+
+@migration(2, 'Add send_records full-text search index')
+def add_send_records_fts(connection):
+    record_search.create_fts(connection)
+
+
+@migration(3, 'Add send_records retry scheduling columns')
+def add_retry_columns(connection):
+    add_column(connection, 'send_records', 'attempts', 'INTEGER DEFAULT 0')
+    add_column(connection, 'send_records', 'next_attempt_at', 'DATETIME')
+    create_indexes(connection, SendRecord.__table__, names=('ix_send_records_status_next_attempt_at',))
+
+
+@migration(4, 'Add smtp_config rate limit columns')
+def add_smtp_rate_limit_columns(connection):
+    add_column(connection, 'smtp_config', 'rate_limit', 'FLOAT DEFAULT 0')
+    add_column(connection, 'smtp_config', 'max_concurrency', 'INTEGER DEFAULT 0')
+
+
+@migration(5, 'Add smtp_config relay name, weight and enabled columns')
+def add_smtp_relay_columns(connection):
+    add_column(connection, 'smtp_config', 'name', 'VARCHAR(100)')
+    add_column(connection, 'smtp_config', 'weight', 'INTEGER DEFAULT 1')
+    add_column(connection, 'smtp_config', 'enabled', 'BOOLEAN DEFAULT TRUE')
+
+
+@migration(6, 'Add send_records per-phase timings column')
+def add_send_timings_column(connection):
+    add_column(connection, 'send_records', 'timings', 'TEXT')
+
+
+@migration(7, 'Add system_logs logger column and indexes')
+def add_system_logs_indexes(connection):
+    add_column(connection, 'system_logs', 'logger', 'VARCHAR(100)')
+    create_indexes(connection, SystemLog.__table__)
\ No newline at end of file
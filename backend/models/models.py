@@ -24,6 +24,7 @@ class SMTPConfig(db.Model):
     __tablename__ = 'smtp_config'
     
     id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
     smtp_server = db.Column(db.String(255), nullable=False)
     smtp_port = db.Column(db.Integer, nullable=False)
     use_tls = db.Column(db.Boolean, default=True)
@@ -31,6 +32,10 @@ class SMTPConfig(db.Model):
     sender_password = db.Column(db.String(255), nullable=False)
     timeout = db.Column(db.Integer, default=30)
     retry_times = db.Column(db.Integer, default=3)
+    rate_limit = db.Column(db.Float, default=0)
+    max_concurrency = db.Column(db.Integer, default=0)
+    weight = db.Column(db.Integer, default=1)
+    enabled = db.Column(db.Boolean, default=True)
     default_recipients = db.Column(db.Text)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -52,6 +57,13 @@ class EmailTemplate(db.Model):
 class SendRecord(db.Model):
     """Send record model"""
     __tablename__ = 'send_records'
+    __table_args__ = (
+        db.Index('ix_send_records_created_at', 'created_at'),
+        db.Index('ix_send_records_status_created_at', 'status', 'created_at'),
+        db.Index('ix_send_records_trigger_source_created_at', 'trigger_source', 'created_at'),
+        db.Index('ix_send_records_template_name', 'template_name'),
+        db.Index('ix_send_records_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     template_name = db.Column(db.String(255))
@@ -67,13 +79,37 @@ class SendRecord(db.Model):
     sent_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     duration = db.Column(db.Integer)
+    timings = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)
+
+
+class SendStatsDaily(db.Model):
+    """Daily send counts, maintained as SendRecord rows are written"""
+    __tablename__ = 'send_stats_daily'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'trigger_source', 'status', 'template_name',
+                            name='uq_send_stats_daily_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    trigger_source = db.Column(db.String(50), nullable=False, default='')
+    status = db.Column(db.String(20), nullable=False)
+    template_name = db.Column(db.String(255), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
 
 
 class SystemLog(db.Model):
     """System log model"""
     __tablename__ = 'system_logs'
+    __table_args__ = (
+        db.Index('ix_system_logs_created_at', 'created_at'),
+        db.Index('ix_system_logs_level_created_at', 'level', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     level = db.Column(db.String(20))
+    logger = db.Column(db.String(100))
     message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Full-text search over send_records subject and recipients
+
+On SQLite the send_records_fts FTS5 table (trigram tokenizer, so substring
+queries behave like the old LIKE '%x%' filter, CJK included) is kept in
+sync by triggers, which also covers Core bulk inserts and deletes. Other
+databases, SQLite builds without FTS5, and queries shorter than three
+characters (below trigram length) fall back to LIKE.
+"""
+import logging
+from sqlalchemy import literal_column, func, text, table, column
+from sqlalchemy.exc import OperationalError
+from models.models import SendRecord
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'send_records_fts'
+MIN_QUERY_LENGTH = 3
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        subject, recipients,
+        content='send_records', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS send_records_fts_ai AFTER INSERT ON send_records BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, subject, recipients)
+        VALUES (new.id, new.subject, new.recipients);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS send_records_fts_ad AFTER DELETE ON send_records BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, recipients)
+        VALUES ('delete', old.id, old.subject, old.recipients);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS send_records_fts_au AFTER UPDATE OF subject, recipients ON send_records BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, recipients)
+        VALUES ('delete', old.id, old.subject, old.recipients);
+        INSERT INTO {FTS_TABLE}(rowid, subject, recipients)
+        VALUES (new.id, new.subject, new.recipients);
+    END""",
+]
+
+fts_table = table(FTS_TABLE, column('rowid'))
+
+_available = {}
+
+
+def create_fts(connection):
+    """Create and populate the FTS index; returns False when unsupported"""
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    try:
+        with connection.begin_nested():
+            for statement in _DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError as e:
+        logger.warning(f'SQLite FTS5 trigram index unavailable, search uses LIKE: {str(e)}')
+        return False
+    return True
+
+
+def fts_available(session):
+    """Whether send_records_fts exists in the bound database"""
+    engine = session.get_bind()
+    if engine.url not in _available:
+        found = False
+        if engine.dialect.name == 'sqlite':
+            found = session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first() is not None
+        _available[engine.url] = found
+    return _available[engine.url]
+
+
+def fts_phrase(search):
+    """Quote user input as a single FTS5 phrase"""
+    return '"' + search.replace('"', '""') + '"'
+
+
+def apply_search(query, session, search, ranked=True):
+    """Filter query by search text
+
+    With ranked=True results matched through the FTS index are ordered by
+    bm25 relevance first.
+    """
+    if len(search) >= MIN_QUERY_LENGTH and fts_available(session):
+        fts = literal_column(FTS_TABLE)
+        query = query.join(
+            fts_table, fts_table.c.rowid == SendRecord.id
+        ).filter(
+            fts.op('MATCH')(fts_phrase(search))
+        )
+        if ranked:
+            query = query.order_by(func.bm25(fts))
+        return query
+
+    query = query.filter(
+        (SendRecord.recipients.like(f'%{search}%')) |
+        (SendRecord.subject.like(f'%{search}%'))
+    )
+    return query
@@ -0,0 +1,147 @@
+"""Write-time maintenance of the send_stats_daily rollup
+
+ORM inserts, status changes and deletes of SendRecord rows are turned into
+count deltas in before_flush and applied in after_flush, inside the same
+transaction. Code that writes send_records with Core statements (bulk
+inserts, conditional status updates) must call apply_deltas() itself.
+Bulk deletes done for archival deliberately leave the rollup untouched so
+history survives retention.
+"""
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import event, func, insert, select, update, delete, and_, inspect
+from sqlalchemy.dialects import sqlite, postgresql
+from flask_sqlalchemy.session import Session
+from models.models import SendRecord, SendStatsDaily
+
+_DELTAS_KEY = 'send_stats_deltas'
+
+
+def stats_key(created_at, trigger_source, status, template_name):
+    """Rollup key for one record: (day, source, status, template)"""
+    return (
+        (created_at or datetime.utcnow()).date(),
+        trigger_source or '',
+        status or 'pending',
+        template_name or ''
+    )
+
+
+def record_key(record, status=None):
+    return stats_key(record.created_at, record.trigger_source,
+                     status if status is not None else record.status,
+                     record.template_name)
+
+
+def apply_deltas(connection, deltas):
+    """Add count deltas {key: n} to send_stats_daily on connection"""
+    table = SendStatsDaily.__table__
+    dialect = connection.dialect.name
+
+    for (day, source, status, template_name), delta in deltas.items():
+        if not delta:
+            continue
+
+        values = {
+            'day': day,
+            'trigger_source': source,
+            'status': status,
+            'template_name': template_name,
+            'count': delta
+        }
+
+        if dialect in ('sqlite', 'postgresql'):
+            dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = dialect_insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['day', 'trigger_source', 'status', 'template_name'],
+                set_={'count': table.c.count + stmt.excluded.count}
+            )
+            connection.execute(stmt)
+            continue
+
+        result = connection.execute(
+            update(table)
+            .where(and_(
+                table.c.day == day,
+                table.c.trigger_source == source,
+                table.c.status == status,
+                table.c.template_name == template_name
+            ))
+            .values(count=table.c.count + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**values))
+
+
+def backfill(session, since=None):
+    """Rebuild send_stats_daily from the rows currently in send_records
+
+    Records removed by archival are no longer counted afterwards; pass
+    since (a date) to rebuild only the days from then on.
+    """
+    day = func.date(SendRecord.created_at)
+    source = func.coalesce(SendRecord.trigger_source, '')
+    status = func.coalesce(SendRecord.status, 'pending')
+    template_name = func.coalesce(SendRecord.template_name, '')
+
+    clear = delete(SendStatsDaily)
+    counts = select(day, source, status, template_name, func.count())
+    if since is not None:
+        clear = clear.where(SendStatsDaily.day >= since)
+        counts = counts.where(SendRecord.created_at >= datetime.combine(since, datetime.min.time()))
+
+    session.execute(clear)
+    result = session.execute(
+        insert(SendStatsDaily).from_select(
+            ['day', 'trigger_source', 'status', 'template_name', 'count'],
+            counts.group_by(day, source, status, template_name)
+        )
+    )
+    session.commit()
+    return result.rowcount
+
+
+def backfill_if_empty(session):
+    """Backfill once for databases that had records before the rollup existed"""
+    if session.query(SendStatsDaily.id).first() is not None:
+        return 0
+    if session.query(SendRecord.id).first() is None:
+        return 0
+    return backfill(session)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deltas(session, flush_context, instances):
+    deltas = session.info.setdefault(_DELTAS_KEY, Counter())
+
+    for obj in session.new:
+        if isinstance(obj, SendRecord):
+            if obj.created_at is None:
+                obj.created_at = datetime.utcnow()
+            deltas[record_key(obj)] += 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, SendRecord):
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.has_changes() or not history.deleted:
+            continue
+        deltas[record_key(obj, status=history.deleted[0])] -= 1
+        deltas[record_key(obj)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, SendRecord):
+            deltas[record_key(obj)] -= 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_deltas(session, flush_context):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_deltas(session, previous_transaction):
+    session.info.pop(_DELTAS_KEY, None)
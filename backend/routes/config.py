@@ -3,6 +3,10 @@ from models.database import db
 from models.models import SMTPConfig
 from utils.crypto import CryptoHandler
 from utils.mail_sender import MailSender
+from utils.smtp_pool import smtp_pool
+from utils.smtp_settings import smtp_settings, SMTPSettings
+from utils.relays import relay_balancer
+from utils.circuit_breaker import circuit_breakers
 from utils.decorators import login_required
 import json
 import logging
@@ -11,12 +15,18 @@ config_bp = Blueprint('config', __name__)
 logger = logging.getLogger(__name__)
 crypto = CryptoHandler()
 
+def reload_relays():
+    """Drop cached settings and idle connections after relays change"""
+    smtp_settings.invalidate()
+    smtp_pool.clear()
+
+
 @config_bp.route('/smtp', methods=['GET'])
 @login_required
 def get_smtp_config():
-    """Get SMTP configuration"""
+    """Get SMTP configuration (the primary relay, lowest id)"""
     try:
-        config = SMTPConfig.query.first()
+        config = SMTPConfig.query.order_by(SMTPConfig.id).first()
         
         if not config:
             logger.info('No SMTP configuration found')
@@ -31,6 +41,8 @@ def get_smtp_config():
             'sender_email': config.sender_email,
             'timeout': config.timeout,
             'retry_times': config.retry_times,
+            'rate_limit': config.rate_limit or 0,
+            'max_concurrency': config.max_concurrency or 0,
             'updated_at': config.updated_at.isoformat() if config.updated_at else None
         }), 200
     except Exception as e:
@@ -41,10 +53,12 @@ def get_smtp_config():
 @config_bp.route('/smtp', methods=['POST'])
 @login_required
 def update_smtp_config():
-    """Update SMTP configuration"""
+    """Update SMTP configuration (the primary relay, lowest id)"""
     try:
         data = request.get_json()
-        logger.info(f'Updating SMTP config with data: {data}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Updating SMTP config with data: %s',
+                         {k: v for k, v in data.items() if k != 'sender_password'})
         
         # 验证必填字段
         if not data.get('smtp_server') or not data.get('smtp_port') or not data.get('sender_email'):
@@ -56,7 +70,7 @@ def update_smtp_config():
             return jsonify({'error': 'sender_password is required'}), 400
         
         # 获取或创建SMTP配置
-        config = SMTPConfig.query.first()
+        config = SMTPConfig.query.order_by(SMTPConfig.id).first()
         
         if not config:
             config = SMTPConfig()
@@ -69,6 +83,9 @@ def update_smtp_config():
         config.sender_email = data.get('sender_email')
         config.timeout = data.get('timeout', 30)
         config.retry_times = data.get('retry_times', 3)
+        # 中继限流：每秒发送数和最大并发会话数，0 表示不限制
+        config.rate_limit = max(0.0, float(data.get('rate_limit') or 0))
+        config.max_concurrency = max(0, int(data.get('max_concurrency') or 0))
         
         # 加密并保存密码
         password = data.get('sender_password')
@@ -80,6 +97,9 @@ def update_smtp_config():
         db.session.add(config)
         db.session.commit()
         
+        # 刷新配置缓存，旧账号的空闲连接不再使用
+        reload_relays()
+        
         logger.info(f'SMTP config updated successfully by user {session.get("username")}')
         return jsonify({'message': 'SMTP configuration saved successfully'}), 200
     
@@ -92,39 +112,37 @@ def update_smtp_config():
 @config_bp.route('/smtp/test', methods=['POST'])
 @login_required
 def test_smtp_connection():
-    """Test SMTP connection"""
+    """Test SMTP connection of the primary relay (the one /smtp edits)"""
     try:
         logger.info('Testing SMTP connection...')
         
-        config = SMTPConfig.query.first()
+        # 与 /smtp 表单一致，测试 id 最小的中继
+        model = SMTPConfig.query.order_by(SMTPConfig.id).first()
         
-        if not config:
+        if not model:
             logger.warning('SMTP configuration not found for test')
             return jsonify({
                 'success': False,
                 'message': 'SMTP configuration not configured yet'
             }), 400
         
-        # 验证配置完整性
-        if not config.smtp_server or not config.smtp_port or not config.sender_email:
-            logger.warning('SMTP configuration incomplete')
-            return jsonify({
-                'success': False,
-                'message': 'SMTP configuration is incomplete'
-            }), 400
-        
-        # 解密密码
         try:
-            decrypted_password = crypto.decrypt(config.sender_password)
+            password = crypto.decrypt(model.sender_password)
         except Exception as e:
-            logger.error(f'Error decrypting password: {str(e)}')
+            logger.error(f'Error decrypting SMTP password: {str(e)}')
             return jsonify({
                 'success': False,
                 'message': 'Error decrypting SMTP password'
             }), 400
+        config = SMTPSettings.from_model(model, password)
         
-        # 创建临时配置对象用于测试
-        config.sender_password = decrypted_password
+        # 验证配置完整性
+        if not config.smtp_server or not config.smtp_port or not config.sender_email:
+            logger.warning('SMTP configuration incomplete')
+            return jsonify({
+                'success': False,
+                'message': 'SMTP configuration is incomplete'
+            }), 400
         
         # 测试连接
         sender = MailSender(config)
@@ -148,4 +166,144 @@ def test_smtp_connection():
         return jsonify({
             'success': False,
             'message': f'Connection test failed: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+# ============ 多中继管理 ============
+
+def relay_dict(config):
+    return {
+        'id': config.id,
+        'name': config.name or f'{config.smtp_server}:{config.smtp_port}',
+        'smtp_server': config.smtp_server,
+        'smtp_port': config.smtp_port,
+        'use_tls': config.use_tls,
+        'sender_email': config.sender_email,
+        'timeout': config.timeout,
+        'retry_times': config.retry_times,
+        'rate_limit': config.rate_limit or 0,
+        'max_concurrency': config.max_concurrency or 0,
+        'weight': config.weight if config.weight is not None else 1,
+        'enabled': config.enabled is not False,
+        'updated_at': config.updated_at.isoformat() if config.updated_at else None,
+        'health': relay_balancer.health(config.id),
+        'circuit': circuit_breakers.get(config.id).to_dict()
+    }
+
+
+def apply_relay_fields(config, data):
+    """Copy relay fields present in data onto config, encrypting the password"""
+    for field in ('name', 'smtp_server', 'sender_email'):
+        if field in data:
+            setattr(config, field, data[field])
+    if 'smtp_port' in data:
+        config.smtp_port = int(data['smtp_port'])
+    if 'use_tls' in data:
+        config.use_tls = bool(data['use_tls'])
+    if 'timeout' in data:
+        config.timeout = int(data['timeout'])
+    if 'retry_times' in data:
+        config.retry_times = max(0, int(data['retry_times']))
+    if 'rate_limit' in data:
+        config.rate_limit = max(0.0, float(data['rate_limit'] or 0))
+    if 'max_concurrency' in data:
+        config.max_concurrency = max(0, int(data['max_concurrency'] or 0))
+    if 'weight' in data:
+        config.weight = max(0, int(data['weight']))
+    if 'enabled' in data:
+        config.enabled = bool(data['enabled'])
+    if data.get('sender_password'):
+        config.sender_password = crypto.encrypt(data['sender_password'])
+
+
+@config_bp.route('/relays', methods=['GET'])
+@login_required
+def list_relays():
+    """List SMTP relays with their weights and health"""
+    relays = SMTPConfig.query.order_by(SMTPConfig.id).all()
+    return jsonify({'relays': [relay_dict(r) for r in relays]}), 200
+
+
+@config_bp.route('/relays', methods=['POST'])
+@login_required
+def create_relay():
+    """Add an SMTP relay"""
+    data = request.get_json() or {}
+    
+    if not data.get('smtp_server') or not data.get('smtp_port') or not data.get('sender_email'):
+        return jsonify({'error': 'Missing required fields: smtp_server, smtp_port, sender_email'}), 400
+    
+    if not data.get('sender_password'):
+        return jsonify({'error': 'sender_password is required'}), 400
+    
+    config = SMTPConfig()
+    try:
+        apply_relay_fields(config, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid relay field: {str(e)}'}), 400
+    
+    db.session.add(config)
+    db.session.commit()
+    reload_relays()
+    
+    logger.info(f'SMTP relay {config.id} created by user {session.get("username")}')
+    return jsonify(relay_dict(config)), 201
+
+
+@config_bp.route('/relays/<int:relay_id>', methods=['PUT'])
+@login_required
+def update_relay(relay_id):
+    """Update an SMTP relay; omitted fields (including the password) are kept"""
+    config = SMTPConfig.query.get(relay_id)
+    
+    if not config:
+        return jsonify({'error': 'Relay not found'}), 404
+    
+    try:
+        apply_relay_fields(config, request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid relay field: {str(e)}'}), 400
+    
+    db.session.commit()
+    reload_relays()
+    
+    logger.info(f'SMTP relay {relay_id} updated by user {session.get("username")}')
+    return jsonify(relay_dict(config)), 200
+
+
+@config_bp.route('/relays/<int:relay_id>', methods=['DELETE'])
+@login_required
+def delete_relay(relay_id):
+    """Delete an SMTP relay"""
+    config = SMTPConfig.query.get(relay_id)
+    
+    if not config:
+        return jsonify({'error': 'Relay not found'}), 404
+    
+    db.session.delete(config)
+    db.session.commit()
+    reload_relays()
+    relay_balancer.forget(relay_id)
+    circuit_breakers.forget(relay_id)
+    
+    logger.info(f'SMTP relay {relay_id} deleted by user {session.get("username")}')
+    return jsonify({'message': 'Relay deleted'}), 200
+
+
+@config_bp.route('/relays/<int:relay_id>/test', methods=['POST'])
+@login_required
+def test_relay(relay_id):
+    """Test the connection to one SMTP relay"""
+    config = SMTPConfig.query.get(relay_id)
+    
+    if not config:
+        return jsonify({'error': 'Relay not found'}), 404
+    
+    try:
+        password = crypto.decrypt(config.sender_password)
+    except Exception as e:
+        logger.error(f'Error decrypting password of relay {relay_id}: {str(e)}')
+        return jsonify({'success': False, 'message': 'Error decrypting SMTP password'}), 400
+    
+    result = MailSender(SMTPSettings.from_model(config, password)).test_connection()
+    return jsonify(result), 200 if result['success'] else 400
\ No newline at end of file
@@ -1,103 +1,292 @@
-from flask import Blueprint, request, jsonify, session, send_file
-from models.models import SendRecord
+from flask import Blueprint, request, jsonify, session, send_file, current_app, Response
+from models.database import db
+from models.models import SendStatsDaily, SystemLog
+from sqlalchemy import func, case
 from utils.decorators import login_required
+from utils.markdown_cache import markdown_renderer
+from utils.template_engine import template_cache
+from utils.smtp_settings import smtp_settings, SMTPSettingsError
+from utils.circuit_breaker import circuit_breakers
+from utils.latency import latency_stats
+from utils.smtp_pool import smtp_pool
+from utils.metrics import metrics, MetricWriter, CONTENT_TYPE
+from utils.send_queue import send_queue
+from utils.system_sampler import system_sampler
+from utils.log_tail import tail, read_since
+from utils.log_handler import dropped_records
+from utils.pagination import keyset_page
 from datetime import datetime, timedelta
-import psutil
 import os
 import logging
 import io
+import hmac
 
 monitor_bp = Blueprint('monitor', __name__)
 logger = logging.getLogger(__name__)
 
 # 删除 login_required 定义
 
+def relay_status():
+    """Circuit breaker state of each enabled relay in this process"""
+    try:
+        relays = smtp_settings.get_all()
+    except SMTPSettingsError:
+        relays = ()
+    
+    return [
+        dict(id=relay.id, name=relay.name, **circuit_breakers.get(relay.id).to_dict())
+        for relay in relays
+    ]
+
+
 @monitor_bp.route('/status', methods=['GET'])
 @login_required
 def get_system_status():
-    """Get system running status"""
+    """Get system running status
+    
+    Returns the sampler's latest snapshot without blocking; history=N adds
+    the last N samples (oldest first) for sparkline charts.
+    """
     try:
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        
-        current_process = psutil.Process(os.getpid())
-        process_memory = current_process.memory_info().rss / (1024 * 1024)
-        process_cpu = current_process.cpu_percent(interval=1)
-        
-        return jsonify({
+        snapshot = system_sampler.latest()
+        response = {
             'status': 'running',
-            'cpu_percent': cpu_percent,
-            'memory': {
-                'total': memory.total / (1024 ** 3),
-                'used': memory.used / (1024 ** 3),
-                'percent': memory.percent
-            },
-            'process': {
-                'memory_mb': process_memory,
-                'cpu_percent': process_cpu
-            },
+            **snapshot,
+            'relays': relay_status(),
+            'smtp_pool': smtp_pool.stats(),
             'timestamp': datetime.utcnow().isoformat()
-        }), 200
+        }
+        
+        history = request.args.get('history', 0, type=int)
+        if history > 0:
+            response['history'] = system_sampler.history(history)
+        
+        return jsonify(response), 200
     
     except Exception as e:
         logger.error(f'Error getting system status: {str(e)}')
         return jsonify({'error': f'Failed to get system status: {str(e)}'}), 500
 
 
+@monitor_bp.route('/cache', methods=['GET'])
+@login_required
+def get_cache_stats():
+    """Get render cache hit/miss counters"""
+    return jsonify({
+        'markdown': markdown_renderer.stats(),
+        'template': template_cache.stats()
+    }), 200
+
+
+@monitor_bp.route('/latency', methods=['GET'])
+@login_required
+def get_latency_stats():
+    """Get per-phase send latency percentiles (ms) for this process
+    
+    The histograms are cumulative since process start; they also back
+    smtp_phase_duration_seconds in /metrics and are never reset.
+    """
+    return jsonify({
+        'phases': latency_stats.summary(),
+        'pid': os.getpid(),
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
+
+def render_metrics():
+    """Current metrics as a Prometheus text exposition document"""
+    writer = MetricWriter()
+    
+    writer.scalar(
+        'deliveries_total', 'counter', 'Delivery outcomes recorded by this process',
+        metrics.deliveries.collect(), ('status', 'source', 'template')
+    )
+    
+    # 来自汇总表，多进程部署时各进程结果一致；汇总表保留已归档删除的记录，不等于 send_records 的当前行数
+    rows = db.session.query(
+        SendStatsDaily.status, func.sum(SendStatsDaily.count)
+    ).group_by(SendStatsDaily.status).all()
+    writer.scalar(
+        'send_records_created', 'gauge', 'Records ever created, by last known status, including archived ones',
+        {(status,): int(count or 0) for status, count in rows}, ('status',)
+    )
+    writer.scalar(
+        'send_queue_depth', 'gauge', 'Record ids waiting for a send worker in this process',
+        {(): send_queue.depth()}
+    )
+    
+    writer.histogram(
+        'smtp_phase_duration_seconds', 'Time spent in each phase of a send',
+        {(phase,): entry for phase, entry in latency_stats.snapshot().items()}, ('phase',)
+    )
+    writer.scalar(
+        'relay_circuit_open', 'gauge', 'Whether the relay circuit breaker is open (1) or not (0)',
+        {(relay['name'],): int(relay['state'] == 'open') for relay in relay_status()}, ('relay',)
+    )
+    
+    caches = {'markdown': markdown_renderer.stats(), 'template': template_cache.stats()}
+    writer.scalar(
+        'cache_hits_total', 'counter', 'Render cache hits',
+        {(name,): stats['hits'] for name, stats in caches.items()}, ('cache',)
+    )
+    writer.scalar(
+        'cache_misses_total', 'counter', 'Render cache misses',
+        {(name,): stats['misses'] for name, stats in caches.items()}, ('cache',)
+    )
+    writer.scalar(
+        'cache_entries', 'gauge', 'Entries held by each render cache',
+        {(name,): stats['size'] for name, stats in caches.items()}, ('cache',)
+    )
+    
+    writer.histogram(
+        'db_query_duration_seconds', 'Database statement execution time',
+        metrics.db_latency.collect(), ('operation',)
+    )
+    writer.scalar(
+        'http_requests_total', 'counter', 'HTTP requests by route endpoint',
+        metrics.requests.collect(), ('endpoint', 'method', 'status')
+    )
+    writer.histogram(
+        'http_request_duration_seconds', 'HTTP request latency by route endpoint',
+        metrics.request_latency.collect(), ('endpoint', 'method')
+    )
+    writer.scalar(
+        'log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full',
+        {(): dropped_records()}
+    )
+    writer.scalar(
+        'process_start_time_seconds', 'gauge', 'Start time of this process (unix seconds)',
+        {(): metrics.started_at}
+    )
+    return writer.render()
+
+
+@monitor_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint
+    
+    Accepts a logged-in session or `Authorization: Bearer <METRICS_TOKEN>`;
+    the endpoint is only open when METRICS_PUBLIC is set.
+    """
+    if not current_app.config.get('METRICS_PUBLIC') and 'user_id' not in session:
+        token = current_app.config.get('METRICS_TOKEN')
+        supplied = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Not authenticated'}), 401
+    
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
 @monitor_bp.route('/logs', methods=['GET'])
 @login_required
 def get_system_logs():
-    """Get system logs"""
+    """Get system logs
+    
+    Returns the last `lines` entries of the log and its rotated backups,
+    optionally filtered by level (comma-separated, or ALL). Pass the
+    returned cursor back as `since` to poll for entries written after it.
+    """
     level = request.args.get('level', 'ALL', type=str)
     lines = request.args.get('lines', 100, type=int)
+    since = request.args.get('since')
+    levels = None if level.upper() == 'ALL' else [l.strip().upper() for l in level.split(',') if l.strip()]
     
     log_file = 'logs/app.log'
     
     try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r', encoding='utf-8') as f:
-                all_logs = f.readlines()
-            
-            if level != 'ALL':
-                all_logs = [log for log in all_logs if level in log]
-            
-            logs = all_logs[-lines:]
-            
-            return jsonify({
-                'logs': logs,
-                'total_lines': len(logs),
-                'level': level
-            }), 200
+        if since:
+            logs, cursor = read_since(log_file, since, lines=lines, levels=levels)
         else:
-            return jsonify({'logs': [], 'total_lines': 0}), 200
+            logs, cursor = tail(log_file, lines=lines, levels=levels)
+        
+        return jsonify({
+            'logs': logs,
+            'total_lines': len(logs),
+            'level': level,
+            'cursor': cursor
+        }), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     except Exception as e:
         logger.error(f'Error reading logs: {str(e)}')
         return jsonify({'error': f'Failed to read logs: {str(e)}'}), 500
 
 
+def parse_time(value):
+    """ISO date or datetime query parameter (UTC)"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid time: {value}')
+
+
+@monitor_bp.route('/system-logs', methods=['GET'])
+@login_required
+def get_stored_logs():
+    """Query WARNING+ log entries stored in system_logs, newest first
+    
+    Filters: level (comma-separated), start / end (ISO date or datetime,
+    end exclusive), logger (prefix). Paginated with cursor / next_cursor.
+    """
+    level = request.args.get('level', 'ALL', type=str)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 500))
+    
+    query = SystemLog.query
+    
+    try:
+        if level.upper() != 'ALL':
+            query = query.filter(SystemLog.level.in_(
+                [l.strip().upper() for l in level.split(',') if l.strip()]
+            ))
+        if request.args.get('start'):
+            query = query.filter(SystemLog.created_at >= parse_time(request.args['start']))
+        if request.args.get('end'):
+            query = query.filter(SystemLog.created_at < parse_time(request.args['end']))
+        if request.args.get('logger'):
+            query = query.filter(SystemLog.logger.startswith(request.args['logger'], autoescape=True))
+        
+        rows, next_cursor = keyset_page(query, SystemLog, request.args.get('cursor'), per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'logs': [{
+            'id': row.id,
+            'level': row.level,
+            'logger': row.logger,
+            'message': row.message,
+            'created_at': row.created_at.isoformat()
+        } for row in rows],
+        'next_cursor': next_cursor,
+        'per_page': per_page
+    }), 200
+
+
 @monitor_bp.route('/stats/daily', methods=['GET'])
 @login_required
 def get_daily_stats():
     """Get daily statistics"""
     days = request.args.get('days', 7, type=int)
     
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
+    
+    rows = db.session.query(
+        SendStatsDaily.day,
+        func.sum(SendStatsDaily.count),
+        func.sum(case((SendStatsDaily.status == 'success', SendStatsDaily.count), else_=0))
+    ).filter(
+        SendStatsDaily.day >= first_day
+    ).group_by(SendStatsDaily.day).all()
+    
+    by_day = {day: (total or 0, success or 0) for day, total, success in rows}
+    
     stats = []
     for i in range(days - 1, -1, -1):
-        date = (datetime.utcnow() - timedelta(days=i)).date()
-        date_start = datetime.combine(date, datetime.min.time())
-        date_end = date_start + timedelta(days=1)
-        
-        total = SendRecord.query.filter(
-            SendRecord.created_at >= date_start,
-            SendRecord.created_at < date_end
-        ).count()
-        
-        success = SendRecord.query.filter(
-            SendRecord.status == 'success',
-            SendRecord.created_at >= date_start,
-            SendRecord.created_at < date_end
-        ).count()
+        date = today - timedelta(days=i)
+        total, success = by_day.get(date, (0, 0))
         
         stats.append({
             'date': date.isoformat(),
@@ -114,25 +303,24 @@ def get_daily_stats():
 @login_required
 def get_trigger_sources_stats():
     """Get trigger sources statistics"""
-    sources = {}
-    
-    for record in SendRecord.query.all():
-        source = record.trigger_source or 'unknown'
-        if source not in sources:
-            sources[source] = {'total': 0, 'success': 0}
-        
-        sources[source]['total'] += 1
-        if record.status == 'success':
-            sources[source]['success'] += 1
+    rows = db.session.query(
+        SendStatsDaily.trigger_source,
+        func.sum(SendStatsDaily.count),
+        func.sum(case((SendStatsDaily.status == 'success', SendStatsDaily.count), else_=0))
+    ).group_by(SendStatsDaily.trigger_source).all()
     
     stats = []
-    for source, data in sources.items():
+    for source, total, success in rows:
+        total = total or 0
+        success = success or 0
+        if total <= 0:
+            continue
         stats.append({
-            'source': source,
-            'total': data['total'],
-            'success': data['success'],
-            'failed': data['total'] - data['success'],
-            'success_rate': (data['success'] / data['total'] * 100) if data['total'] > 0 else 0
+            'source': source or 'unknown',
+            'total': total,
+            'success': success,
+            'failed': total - success,
+            'success_rate': (success / total * 100) if total > 0 else 0
         })
     
     return jsonify({'stats': stats}), 200
\ No newline at end of file
@@ -1,26 +1,33 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app, Response, stream_with_context
 from models.database import db
-from models.models import SendRecord
+from models.models import SendRecord, SendStatsDaily
+from models.record_search import apply_search
+from sqlalchemy import func, case, and_
 from utils.decorators import login_required
+from utils.ttl_cache import TTLCache
+from utils.pagination import keyset_page
+from utils.bulk_retry import bulk_retry
+from utils.send_queue import build_sender, claim_record, store_outcome
+from utils.metrics import metrics
+from werkzeug.datastructures import MultiDict
 from datetime import datetime, timedelta
+import csv
+import io
 import json
 import logging
 
 records_bp = Blueprint('records', __name__)
 logger = logging.getLogger(__name__)
+stats_cache = TTLCache()
 
 # 删除 login_required 定义
 
-@records_bp.route('/', methods=['GET'])
-@login_required
-def list_records():
-    """Get send records list"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    status = request.args.get('status', 'all', type=str)
-    start_date = request.args.get('start_date', type=str)
-    end_date = request.args.get('end_date', type=str)
-    search = request.args.get('search', '', type=str)
+def filter_records(args, ranked=True):
+    """Build the SendRecord query for the status/date/search filters in args"""
+    status = args.get('status', 'all', type=str)
+    start_date = args.get('start_date', type=str)
+    end_date = args.get('end_date', type=str)
+    search = args.get('search', '', type=str)
     
     query = SendRecord.query
     
@@ -36,15 +43,29 @@ def list_records():
         query = query.filter(SendRecord.created_at < end)
     
     if search:
-        query = query.filter(
-            (SendRecord.recipients.like(f'%{search}%')) |
-            (SendRecord.subject.like(f'%{search}%'))
-        )
+        # 使用全文索引时按相关度排序，相同相关度再按时间倒序
+        query = apply_search(query, db.session, search, ranked=ranked)
     
-    query = query.order_by(SendRecord.created_at.desc())
-    paginated = query.paginate(page=page, per_page=per_page)
-    
-    records = [{
+    return query
+
+
+# 列表只读取摘要列，跳过 content / variables_used 等大字段和 ORM 实体构建
+SUMMARY_COLUMNS = (
+    SendRecord.id,
+    SendRecord.template_name,
+    SendRecord.recipients,
+    SendRecord.subject,
+    SendRecord.status,
+    SendRecord.trigger_source,
+    SendRecord.created_at,
+    SendRecord.sent_at,
+    SendRecord.duration,
+    SendRecord.error_msg
+)
+
+
+def record_summary(r):
+    return {
         'id': r.id,
         'template_name': r.template_name,
         'recipients': json.loads(r.recipients or '[]'),
@@ -55,7 +76,44 @@ def list_records():
         'sent_at': r.sent_at.isoformat() if r.sent_at else None,
         'duration': r.duration,
         'error_msg': r.error_msg
-    } for r in paginated.items]
+    }
+
+
+@records_bp.route('/', methods=['GET'])
+@login_required
+def list_records():
+    """Get send records list
+    
+    Passing cursor (empty for the first page) switches to keyset pagination
+    on (created_at, id): the response carries next_cursor, and total only
+    when include_total=1.
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 500))
+    
+    if 'cursor' in request.args:
+        query = filter_records(request.args, ranked=False)
+        try:
+            rows, next_cursor = keyset_page(
+                query.with_entities(*SUMMARY_COLUMNS), SendRecord, request.args['cursor'], per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = {
+            'records': [record_summary(r) for r in rows],
+            'next_cursor': next_cursor,
+            'per_page': per_page
+        }
+        if request.args.get('include_total', 0, type=int):
+            result['total'] = query.order_by(None).count()
+        return jsonify(result), 200
+    
+    query = filter_records(request.args).with_entities(*SUMMARY_COLUMNS)
+    query = query.order_by(SendRecord.created_at.desc())
+    paginated = query.paginate(page=page, per_page=per_page)
+    
+    records = [record_summary(r) for r in paginated.items]
     
     return jsonify({
         'records': records,
@@ -65,6 +123,93 @@ def list_records():
     }), 200
 
 
+EXPORT_COLUMNS = SUMMARY_COLUMNS + (
+    SendRecord.cc,
+    SendRecord.bcc
+)
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iter_export_rows(query, include_content):
+    """Yield export dicts while the database cursor streams rows"""
+    columns = EXPORT_COLUMNS + ((SendRecord.content,) if include_content else ())
+    query = query.with_entities(*columns).order_by(
+        SendRecord.created_at.desc(), SendRecord.id.desc()
+    ).execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+    
+    for r in query:
+        row = record_summary(r)
+        row['cc'] = json.loads(r.cc or '[]')
+        row['bcc'] = json.loads(r.bcc or '[]')
+        if include_content:
+            row['content'] = r.content
+        yield row
+
+
+def generate_ndjson(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row, ensure_ascii=False))
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def generate_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    
+    for count, row in enumerate(rows, 1):
+        for key in ('recipients', 'cc', 'bcc'):
+            row[key] = ', '.join(row[key])
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+@records_bp.route('/export', methods=['GET'])
+@login_required
+def export_records():
+    """Stream send records as CSV or NDJSON
+    
+    Accepts the same filters as list_records plus format=csv|ndjson and
+    include_content=1. Rows are streamed from a server-side cursor, so
+    memory use does not grow with the number of records.
+    """
+    export_format = request.args.get('format', 'csv', type=str)
+    include_content = bool(request.args.get('include_content', 0, type=int))
+    
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    query = filter_records(request.args, ranked=False)
+    rows = iter_export_rows(query, include_content)
+    filename = f'send_records_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.{export_format}'
+    
+    if export_format == 'ndjson':
+        body = generate_ndjson(rows)
+        mimetype = 'application/x-ndjson'
+    else:
+        fields = [c.key for c in EXPORT_COLUMNS] + (['content'] if include_content else [])
+        body = generate_csv(rows, fields)
+        mimetype = 'text/csv'
+    
+    logger.info(f'Exporting records as {export_format}')
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 @records_bp.route('/<int:record_id>', methods=['GET'])
 @login_required
 def get_record_detail(record_id):
@@ -88,18 +233,22 @@ def get_record_detail(record_id):
         'variables_used': json.loads(record.variables_used or '{}'),
         'created_at': record.created_at.isoformat(),
         'sent_at': record.sent_at.isoformat() if record.sent_at else None,
-        'duration': record.duration
+        'duration': record.duration,
+        'timings': json.loads(record.timings) if record.timings else None,
+        'attempts': record.attempts or 0,
+        'next_attempt_at': record.next_attempt_at.isoformat() if record.next_attempt_at else None
     }), 200
 
 
 @records_bp.route('/<int:record_id>/retry', methods=['POST'])
 @login_required
 def retry_send(record_id):
-    """Retry failed send"""
-    from models.models import SMTPConfig
-    from utils.mail_sender import MailSender
-    from utils.crypto import CryptoHandler
+    """Retry failed send
     
+    Only 'failed' and 'retrying' records can be retried. The record is
+    claimed first, so a record the send queue or retry scheduler is
+    delivering at the same time gets 409 instead of a second copy.
+    """
     record = SendRecord.query.get(record_id)
     
     if not record:
@@ -108,15 +257,15 @@ def retry_send(record_id):
     if record.status == 'success':
         return jsonify({'error': 'Success record cannot be retried'}), 400
     
-    smtp_config = SMTPConfig.query.first()
-    if not smtp_config:
-        return jsonify({'error': 'SMTP not configured'}), 400
+    sender, error = build_sender()
+    if sender is None:
+        return jsonify({'error': error}), 400
     
-    crypto = CryptoHandler()
-    decrypted_password = crypto.decrypt(smtp_config.sender_password)
-    smtp_config.sender_password = decrypted_password
+    lease = claim_record(record_id, statuses=('failed', 'retrying'), send_time=sender.max_send_time())
+    if lease is None:
+        return jsonify({'error': 'Record is already queued or being sent'}), 409
+    record = SendRecord.query.get(record_id)
     
-    sender = MailSender(smtp_config)
     result = sender.send_email(
         recipients=json.loads(record.recipients),
         subject=record.subject,
@@ -126,21 +275,87 @@ def retry_send(record_id):
         is_markdown=True
     )
     
+    values = {'attempts': (record.attempts or 0) + 1, 'next_attempt_at': None}
+    if 'timings' in result:
+        values['timings'] = json.dumps(result['timings'])
+    
     if result['success']:
-        record.status = 'success'
-        record.sent_at = datetime.utcnow()
-        record.duration = result['duration']
-        record.error_msg = None
+        values.update(status='success', sent_at=datetime.utcnow(), duration=result['duration'], error_msg=None)
     else:
-        record.status = 'failed'
-        record.error_msg = result['message']
+        values.update(status='failed', error_msg=result['message'])
     
-    db.session.commit()
+    outcome = (values['status'], record.trigger_source, record.template_name)
+    if not store_outcome(record, lease, values):
+        return jsonify({'error': 'Send claim expired before the result was stored'}), 409
+    metrics.count_delivery(*outcome)
     
     logger.info(f'Record {record_id} retry: {result["message"]}')
     return jsonify(result), 200 if result['success'] else 500
 
 
+@records_bp.route('/retry', methods=['POST'])
+@login_required
+def bulk_retry_records():
+    """Retry failed records in the background
+    
+    The JSON body selects records with the list filters (start_date,
+    end_date, search) plus template_name and ids; limit caps the number of
+    records and rate the messages per second. Poll GET /retry/<job_id>
+    for progress.
+    """
+    data = request.get_json(silent=True) or {}
+    max_records = current_app.config['RETRY_MAX_RECORDS']
+    
+    try:
+        limit = int(data.get('limit') or max_records)
+        rate = float(data.get('rate', current_app.config['RETRY_RATE']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit and rate must be numbers'}), 400
+    # 负数 limit 在 SQLite 中表示不限制，必须钳制
+    limit = max(1, min(limit, max_records))
+    rate = max(0.0, rate)
+    
+    args = MultiDict({key: data[key] for key in ('start_date', 'end_date', 'search') if data.get(key)})
+    args['status'] = 'failed'
+    query = filter_records(args, ranked=False)
+    
+    if data.get('template_name'):
+        query = query.filter(SendRecord.template_name == data['template_name'])
+    if data.get('ids'):
+        query = query.filter(SendRecord.id.in_(data['ids']))
+    
+    ids = [r.id for r in query.with_entities(SendRecord.id).order_by(SendRecord.id).limit(limit)]
+    
+    if not ids:
+        return jsonify({'message': 'No failed records match', 'total': 0}), 200
+    
+    sender, error = build_sender()
+    if sender is None:
+        return jsonify({'error': error}), 400
+    
+    job = bulk_retry.start(
+        ids,
+        rate=rate,
+        batch_size=current_app.config['RETRY_BATCH_SIZE'],
+        sender=sender
+    )
+    
+    logger.info(f'Bulk retry {job.id} started for {job.total} records')
+    return jsonify(job.to_dict()), 202
+
+
+@records_bp.route('/retry/<job_id>', methods=['GET'])
+@login_required
+def bulk_retry_progress(job_id):
+    """Get bulk retry job progress"""
+    job = bulk_retry.get(job_id)
+    
+    if not job:
+        return jsonify({'error': 'Retry job not found'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
+
 @records_bp.route('/<int:record_id>', methods=['DELETE'])
 @login_required
 def delete_record(record_id):
@@ -157,59 +372,69 @@ def delete_record(record_id):
     return jsonify({'message': 'Record deleted'}), 200
 
 
-@records_bp.route('/stats', methods=['GET'])
-@login_required
-def get_statistics():
-    """Get send statistics"""
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
-    
-    today_total = SendRecord.query.filter(
-        SendRecord.created_at >= today_start,
-        SendRecord.created_at < today_end
-    ).count()
-    
-    today_success = SendRecord.query.filter(
-        SendRecord.status == 'success',
-        SendRecord.created_at >= today_start,
-        SendRecord.created_at < today_end
-    ).count()
+def success_rate(success, total):
+    return (success / total * 100) if total > 0 else 0
+
+
+def compute_statistics():
+    """Count today / this week / all-time sends from the send_stats_daily rollup
     
-    today_failed = today_total - today_success
+    Archival does not decrement the rollup, so totals include archived records.
+    """
+    today = datetime.utcnow().date()
+    week_start = today - timedelta(days=today.weekday())
     
-    week_start = datetime.utcnow() - timedelta(days=datetime.utcnow().weekday())
-    week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    is_success = SendStatsDaily.status == 'success'
+    is_today = SendStatsDaily.day == today
+    is_week = SendStatsDaily.day >= week_start
     
-    week_total = SendRecord.query.filter(
-        SendRecord.created_at >= week_start
-    ).count()
+    def count_if(*conditions):
+        return func.coalesce(func.sum(case((and_(*conditions), SendStatsDaily.count), else_=0)), 0)
     
-    week_success = SendRecord.query.filter(
-        SendRecord.status == 'success',
-        SendRecord.created_at >= week_start
-    ).count()
+    row = db.session.query(
+        func.coalesce(func.sum(SendStatsDaily.count), 0),
+        count_if(is_success),
+        count_if(is_today),
+        count_if(is_today, is_success),
+        count_if(is_week),
+        count_if(is_week, is_success)
+    ).one()
     
-    total_all = SendRecord.query.count()
-    total_success = SendRecord.query.filter_by(status='success').count()
-    total_failed = total_all - total_success
+    total_all, total_success, today_total, today_success, week_total, week_success = row
     
-    return jsonify({
+    return {
         'today': {
             'total': today_total,
             'success': today_success,
-            'failed': today_failed,
-            'success_rate': (today_success / today_total * 100) if today_total > 0 else 0
+            'failed': today_total - today_success,
+            'success_rate': success_rate(today_success, today_total)
         },
         'week': {
             'total': week_total,
             'success': week_success,
             'failed': week_total - week_success,
-            'success_rate': (week_success / week_total * 100) if week_total > 0 else 0
+            'success_rate': success_rate(week_success, week_total)
         },
         'total': {
             'total': total_all,
             'success': total_success,
-            'failed': total_failed,
-            'success_rate': (total_success / total_all * 100) if total_all > 0 else 0
+            'failed': total_all - total_success,
+            'success_rate': success_rate(total_success, total_all)
         }
-    }), 200
\ No newline at end of file
+    }
+
+
+@records_bp.route('/stats', methods=['GET'])
+@login_required
+def get_statistics():
+    """Get send statistics
+    
+    Results are cached for STATS_CACHE_TTL seconds; pass fresh=1 to bypass.
+    """
+    if request.args.get('fresh', 0, type=int):
+        return jsonify(compute_statistics()), 200
+    
+    stats = stats_cache.get_or_compute(
+        'stats', compute_statistics, ttl=current_app.config.get('STATS_CACHE_TTL', 0)
+    )
+    return jsonify(stats), 200
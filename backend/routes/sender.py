@@ -1,21 +1,73 @@
 from flask import Blueprint, request, jsonify, session
 from models.database import db
-from models.models import SendRecord, EmailTemplate, SMTPConfig
-from utils.mail_sender import MailSender
-from utils.crypto import CryptoHandler
+from sqlalchemy import insert
+from models.models import SendRecord, EmailTemplate
+from models.send_stats import apply_deltas, stats_key
+from utils.send_queue import send_queue, deliver_record, build_sender
+from utils.template_engine import template_cache
+from utils.smtp_settings import smtp_settings, SMTPSettingsError
 from utils.decorators import login_required
 from datetime import datetime
+from collections import Counter
 import json
 import logging
 
 sender_bp = Blueprint('sender', __name__)
 logger = logging.getLogger(__name__)
-crypto = CryptoHandler()
+
+BATCH_CHUNK_SIZE = 500
+
+
+def render_template(template, variables):
+    """Render template subject and content with the compiled template cache"""
+    return template_cache.get(template).render(variables)
+
+
+def check_smtp():
+    """Return why mail cannot be sent right now, or None"""
+    try:
+        if smtp_settings.get() is None:
+            return 'SMTP not configured'
+    except SMTPSettingsError as e:
+        return str(e)
+    return None
+
+
+def queue_record(record):
+    """Persist a pending record and hand it to the send queue
+    
+    Returns the HTTP response. Without background workers the record is
+    delivered inline and the final result is returned instead of 202.
+    """
+    db.session.add(record)
+    db.session.commit()
+    
+    if not send_queue.running:
+        result = deliver_record(record.id)
+        return jsonify({
+            'message': result['message'],
+            'success': result['success'],
+            'status': result.get('status', 'success' if result['success'] else 'failed'),
+            'record_id': record.id,
+            'duration': result.get('duration'),
+            'timings': result.get('timings')
+        }), 200 if result['success'] else 202 if result.get('status') == 'retrying' else 400
+    
+    send_queue.enqueue(record.id)
+    logger.debug('Record queued: %s', record.id)
+    
+    return jsonify({
+        'message': 'Email queued for delivery',
+        'success': True,
+        'status': 'queued',
+        'record_id': record.id
+    }), 202
+
 
 @sender_bp.route('/send', methods=['POST'])
 @login_required
 def send_email():
-    """Send email directly"""
+    """Queue email for sending"""
     data = request.get_json()
     
     recipients = data.get('recipients', [])
@@ -28,24 +80,11 @@ def send_email():
     if not recipients or not subject or not content:
         return jsonify({'error': 'Recipients, subject, and content required'}), 400
     
-    smtp_config = SMTPConfig.query.first()
-    if not smtp_config:
-        return jsonify({'error': 'SMTP not configured'}), 400
+    smtp_error = check_smtp()
+    if smtp_error:
+        return jsonify({'error': smtp_error}), 400
     
     try:
-        decrypted_password = crypto.decrypt(smtp_config.sender_password)
-        smtp_config.sender_password = decrypted_password
-        
-        sender = MailSender(smtp_config)
-        result = sender.send_email(
-            recipients=recipients,
-            subject=subject,
-            content=content,
-            cc=cc or None,
-            bcc=bcc or None,
-            is_markdown=True
-        )
-        
         record = SendRecord(
             template_name=template_name,
             recipients=json.dumps(recipients),
@@ -53,38 +92,26 @@ def send_email():
             bcc=json.dumps(bcc) if bcc else None,
             subject=subject,
             content=content,
-            status='success' if result['success'] else 'failed',
-            error_msg=result.get('message') if not result['success'] else None,
+            status='pending',
             trigger_source='web',
-            variables_used=json.dumps({}),
-            sent_at=datetime.utcnow() if result['success'] else None,
-            duration=result.get('duration')
+            variables_used=json.dumps({})
         )
         
-        db.session.add(record)
-        db.session.commit()
-        
-        logger.info(f'Email sent: {result["message"]}')
-        
-        return jsonify({
-            'message': result['message'],
-            'success': result['success'],
-            'record_id': record.id,
-            'duration': result.get('duration')
-        }), 200 if result['success'] else 400
+        return queue_record(record)
     
     except Exception as e:
         logger.error(f'Error sending email: {str(e)}')
+        db.session.rollback()
         return jsonify({'error': f'Error: {str(e)}'}), 500
 
 
 @sender_bp.route('/send-from-template', methods=['POST'])
 @login_required
 def send_from_template():
-    """Send email using template"""
+    """Queue email using template"""
     try:
         data = request.get_json()
-        logger.info(f'Send from template request: {data}')
+        logger.debug('Send from template request: %s', data)
         
         template_id = data.get('template_id')
         recipients = data.get('recipients', [])
@@ -92,7 +119,7 @@ def send_from_template():
         bcc = data.get('bcc', [])
         variables = data.get('variables', {})
         
-        logger.info(f'Parameters - template_id: {template_id}, recipients: {recipients}')
+        logger.debug('Parameters - template_id: %s, recipients: %s', template_id, recipients)
         
         if not template_id or not recipients:
             logger.warning('Missing template_id or recipients')
@@ -104,105 +131,214 @@ def send_from_template():
             logger.warning(f'Template not found: {template_id}')
             return jsonify({'error': 'Template not found'}), 404
         
-        logger.info(f'Template found: {template.name}')
+        logger.debug('Template found: %s', template.name)
         
         # 替换变量
-        subject = template.subject
-        content = template.content
+        logger.debug('Original subject: %s', template.subject)
+        logger.debug('Variables: %s', variables)
         
-        logger.info(f'Original subject: {subject}')
-        logger.info(f'Variables: {variables}')
+        subject, content = render_template(template, variables)
         
-        # 替换主题中的变量
-        for key, value in variables.items():
-            subject = subject.replace(f'{{{{{key}}}}}', str(value))
-            content = content.replace(f'{{{{{key}}}}}', str(value))
-        
-        logger.info(f'Replaced subject: {subject}')
+        logger.debug('Replaced subject: %s', subject)
         
         # 获取SMTP配置
-        smtp_config = SMTPConfig.query.first()
-        if not smtp_config:
-            logger.error('SMTP not configured')
-            return jsonify({'error': 'SMTP not configured'}), 400
+        smtp_error = check_smtp()
+        if smtp_error:
+            logger.error(smtp_error)
+            return jsonify({'error': smtp_error}), 400
         
-        # 发送邮件
-        try:
-            decrypted_password = crypto.decrypt(smtp_config.sender_password)
-            smtp_config.sender_password = decrypted_password
-            
-            sender = MailSender(smtp_config)
-            result = sender.send_email(
-                recipients=recipients,
-                subject=subject,
-                content=content,
-                cc=cc if cc else None,
-                bcc=bcc if bcc else None,
-                is_markdown=True
-            )
-            
-            logger.info(f'Send result: {result}')
-            
-            # 保存记录
-            record = SendRecord(
-                template_name=template.name,
-                recipients=json.dumps(recipients),
-                cc=json.dumps(cc) if cc else None,
-                bcc=json.dumps(bcc) if bcc else None,
-                subject=subject,
-                content=content,
-                status='success' if result['success'] else 'failed',
-                error_msg=result.get('message') if not result['success'] else None,
-                trigger_source='web',
-                variables_used=json.dumps(variables),
-                sent_at=datetime.utcnow() if result['success'] else None,
-                duration=result.get('duration')
-            )
-            
-            db.session.add(record)
-            db.session.commit()
-            
-            logger.info(f'Record saved: {record.id}')
-            
-            return jsonify({
-                'message': result['message'],
-                'success': result['success'],
-                'record_id': record.id,
-                'duration': result.get('duration')
-            }), 200 if result['success'] else 400
+        # 保存待发送记录并加入队列
+        record = SendRecord(
+            template_name=template.name,
+            recipients=json.dumps(recipients),
+            cc=json.dumps(cc) if cc else None,
+            bcc=json.dumps(bcc) if bcc else None,
+            subject=subject,
+            content=content,
+            status='pending',
+            trigger_source='web',
+            variables_used=json.dumps(variables)
+        )
         
-        except Exception as send_error:
-            logger.error(f'Error in send_email: {str(send_error)}')
-            
-            # 即使发送出错，也尝试保存记录
-            try:
-                record = SendRecord(
-                    template_name=template.name,
-                    recipients=json.dumps(recipients),
-                    cc=json.dumps(cc) if cc else None,
-                    bcc=json.dumps(bcc) if bcc else None,
-                    subject=subject,
-                    content=content,
-                    status='failed',
-                    error_msg=str(send_error),
-                    trigger_source='web',
-                    variables_used=json.dumps(variables),
-                    duration=0
-                )
-                db.session.add(record)
-                db.session.commit()
-            except Exception as record_error:
-                logger.error(f'Error saving record: {str(record_error)}')
-            
-            raise
+        return queue_record(record)
     
     except Exception as error:
         logger.error(f'Error in send_from_template: {str(error)}')
         logger.error(f'Error type: {type(error).__name__}')
         import traceback
         logger.error(traceback.format_exc())
+        db.session.rollback()
         
         return jsonify({
             'error': 'Internal Server Error',
             'message': str(error)
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+def iter_batch_rows():
+    """Yield (header, rows) from a JSON body or an NDJSON stream
+    
+    NDJSON bodies start with a header line such as {"template_id": 1}
+    followed by one recipient row per line, and are read incrementally.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        lines = (line.strip() for line in iter(request.stream.readline, b''))
+        lines = (line for line in lines if line)
+        first = next(lines, None)
+        header = json.loads(first) if first else {}
+        if not isinstance(header, dict):
+            raise ValueError('header line must be a JSON object')
+        return header, (json.loads(line) for line in lines)
+    
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        raise ValueError('body must be a JSON object')
+    rows = data.get('rows') or []
+    if not isinstance(rows, list):
+        raise ValueError('rows must be a list')
+    return data, iter(rows)
+
+
+def is_address_list(value):
+    """Whether value is a list of non-empty address strings"""
+    return isinstance(value, list) and all(isinstance(address, str) and address for address in value)
+
+
+def check_batch_row(row):
+    """Why a batch row cannot be queued, or None"""
+    if not isinstance(row, dict) or not row.get('recipients'):
+        return 'Recipients required'
+    if not is_address_list(row['recipients']):
+        return 'Recipients must be a list of addresses'
+    for field in ('cc', 'bcc'):
+        if row.get(field) is not None and not is_address_list(row[field]):
+            return f'{field} must be a list of addresses'
+    if not isinstance(row.get('variables') or {}, dict):
+        return 'Variables must be an object'
+    return None
+
+
+def build_batch_record(template, row, subject, content, trigger_source):
+    """Build the insert parameters for one batch row"""
+    cc = row.get('cc') or []
+    bcc = row.get('bcc') or []
+    return {
+        'template_name': template.name,
+        'recipients': json.dumps(row['recipients']),
+        'cc': json.dumps(cc) if cc else None,
+        'bcc': json.dumps(bcc) if bcc else None,
+        'subject': subject,
+        'content': content,
+        'status': 'pending',
+        'trigger_source': trigger_source,
+        'variables_used': json.dumps(row.get('variables') or {}),
+        'created_at': datetime.utcnow()
+    }
+
+
+def insert_batch(params):
+    """Bulk insert pending records and return their ids"""
+    ids = db.session.scalars(
+        insert(SendRecord).returning(SendRecord.id, sort_by_parameter_order=True),
+        params
+    ).all()
+    
+    # Core 批量插入不会触发 ORM 事件，需要手动更新统计汇总
+    apply_deltas(db.session.connection(), Counter(
+        stats_key(p['created_at'], p['trigger_source'], p['status'], p['template_name'])
+        for p in params
+    ))
+    db.session.commit()
+    return ids
+
+
+@sender_bp.route('/batch', methods=['POST'])
+@login_required
+def send_batch():
+    """Queue one template rendered for many recipient rows
+    
+    Accepts {"template_id": 1, "rows": [{"recipients": [...], "variables": {...}}]}
+    as JSON, or the same header and rows as application/x-ndjson.
+    """
+    try:
+        header, rows = iter_batch_rows()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid batch body: {str(e)}'}), 400
+    
+    template_id = header.get('template_id')
+    trigger_source = header.get('trigger_source') or 'batch'
+    if not template_id:
+        return jsonify({'error': 'Template ID required'}), 400
+    
+    template = EmailTemplate.query.get(template_id)
+    if not template:
+        return jsonify({'error': 'Template not found'}), 404
+    
+    smtp_error = check_smtp()
+    if smtp_error:
+        return jsonify({'error': smtp_error}), 400
+    
+    queued = send_queue.running
+    if not queued:
+        # 没有后台线程时先建好发送器，失败则不插入任何记录，避免留下无人处理的 pending 记录
+        sender, error = build_sender()
+        if sender is None:
+            return jsonify({'error': error}), 400
+    
+    record_ids = []
+    errors = []
+    chunk = []
+    index = -1
+    
+    def flush(chunk):
+        ids = insert_batch(chunk)
+        record_ids.extend(ids)
+        # 有后台线程时每块提交后立即入队，不等整个流读完
+        if queued:
+            send_queue.enqueue_many(ids)
+    
+    try:
+        for index, row in enumerate(rows):
+            row_error = check_batch_row(row)
+            if row_error:
+                errors.append({'row': index, 'error': row_error})
+                continue
+            
+            subject, content = render_template(template, row.get('variables') or {})
+            chunk.append(build_batch_record(template, row, subject, content, trigger_source))
+            
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                flush(chunk)
+                chunk = []
+    except ValueError as e:
+        # NDJSON 行解析失败时停止读取，已解析的行照常入队
+        logger.error(f'Invalid batch row: {str(e)}')
+        errors.append({'row': index + 1, 'error': f'Invalid JSON: {str(e)}'})
+    
+    if chunk:
+        flush(chunk)
+    
+    logger.info(f'Batch for template {template.name}: {len(record_ids)} queued, {len(errors)} rejected')
+    
+    if not queued:
+        # 没有后台线程时复用同一个发送器逐条投递
+        results = [deliver_record(record_id, sender=sender) for record_id in record_ids]
+        sent = sum(1 for r in results if r and r['success'])
+        return jsonify({
+            'message': f'{sent} of {len(record_ids)} emails sent',
+            'success': sent == len(record_ids),
+            'status': 'completed',
+            'total': len(record_ids),
+            'sent': sent,
+            'record_ids': record_ids,
+            'errors': errors
+        }), 200
+    
+    return jsonify({
+        'message': f'{len(record_ids)} emails queued for delivery',
+        'success': True,
+        'status': 'queued',
+        'total': len(record_ids),
+        'record_ids': record_ids,
+        'errors': errors
+    }), 202
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, session
 from models.database import db
 from models.models import EmailTemplate
+from utils.template_engine import template_cache
+from utils.pagination import keyset_page
 from utils.decorators import login_required
 import json
 import logging
@@ -18,30 +20,64 @@ def extract_variables(text):
     return list(set(re.findall(pattern, text)))
 
 
+SUMMARY_COLUMNS = (
+    EmailTemplate.id,
+    EmailTemplate.name,
+    EmailTemplate.subject,
+    EmailTemplate.created_at,
+    EmailTemplate.updated_at,
+    EmailTemplate.last_used,
+    EmailTemplate.variables
+)
+
+
+def template_summary(t):
+    return {
+        'id': t.id,
+        'name': t.name,
+        'subject': t.subject,
+        'created_at': t.created_at.isoformat(),
+        'updated_at': t.updated_at.isoformat(),
+        'last_used': t.last_used.isoformat() if t.last_used else None,
+        'variables': json.loads(t.variables or '[]')
+    }
+
+
 @template_bp.route('/', methods=['GET'])
 @login_required
 def list_templates():
-    """Get all email templates"""
+    """Get all email templates
+    
+    Passing cursor (empty for the first page) switches to keyset pagination
+    on (created_at, id), newest first.
+    """
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = max(1, min(request.args.get('per_page', 10, type=int), 500))
     search = request.args.get('search', '', type=str)
     
-    query = EmailTemplate.query
+    query = EmailTemplate.query.with_entities(*SUMMARY_COLUMNS)
     
     if search:
         query = query.filter(EmailTemplate.name.like(f'%{search}%'))
     
+    if 'cursor' in request.args:
+        try:
+            rows, next_cursor = keyset_page(query, EmailTemplate, request.args['cursor'], per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = {
+            'templates': [template_summary(t) for t in rows],
+            'next_cursor': next_cursor,
+            'per_page': per_page
+        }
+        if request.args.get('include_total', 0, type=int):
+            result['total'] = query.count()
+        return jsonify(result), 200
+    
     paginated = query.paginate(page=page, per_page=per_page)
     
-    templates = [{
-        'id': t.id,
-        'name': t.name,
-        'subject': t.subject,
-        'created_at': t.created_at.isoformat(),
-        'updated_at': t.updated_at.isoformat(),
-        'last_used': t.last_used.isoformat() if t.last_used else None,
-        'variables': json.loads(t.variables or '[]')
-    } for t in paginated.items]
+    templates = [template_summary(t) for t in paginated.items]
     
     return jsonify({
         'templates': templates,
@@ -137,6 +173,7 @@ def update_template(template_id):
     template.variables = json.dumps(variables)
     
     db.session.commit()
+    template_cache.invalidate(template_id)
     
     logger.info(f'Template updated: {template.name}')
     return jsonify({'message': 'Template updated'}), 200
@@ -154,6 +191,7 @@ def delete_template(template_id):
     template_name = template.name
     db.session.delete(template)
     db.session.commit()
+    template_cache.invalidate(template_id)
     
     logger.info(f'Template deleted: {template_name}')
     return jsonify({'message': 'Template deleted'}), 200
\ No newline at end of file
@@ -1,9 +1,15 @@
 from .mail_sender import MailSender
 from .crypto import CryptoHandler
 from .log_handler import setup_logging
+from .smtp_pool import SMTPConnectionPool, smtp_pool
+from .send_queue import SendQueue, send_queue
 
 __all__ = [
     'MailSender',
     'CryptoHandler',
-    'setup_logging'
+    'setup_logging',
+    'SMTPConnectionPool',
+    'smtp_pool',
+    'SendQueue',
+    'send_queue'
 ]
\ No newline at end of file
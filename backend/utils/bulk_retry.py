@@ -0,0 +1,318 @@
+import threading
+import time
+import uuid
+import json
+import logging
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import update, bindparam, func
+from models.database import db
+from models.models import SendRecord
+from models.send_stats import apply_deltas, stats_key
+from utils.send_queue import build_sender, lease_deadline
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_COLUMNS = (
+    SendRecord.id,
+    SendRecord.recipients,
+    SendRecord.cc,
+    SendRecord.bcc,
+    SendRecord.subject,
+    SendRecord.content,
+    SendRecord.created_at,
+    SendRecord.trigger_source,
+    SendRecord.template_name,
+    SendRecord.sent_at,
+    SendRecord.duration,
+    SendRecord.timings
+)
+
+
+class RetryJob:
+    """Progress of one bulk retry, readable while it runs"""
+
+    def __init__(self, record_ids, rate=0, batch_size=100):
+        self.id = uuid.uuid4().hex
+        self.record_ids = record_ids
+        self.rate = rate
+        self.batch_size = batch_size
+        self.state = 'queued'
+        self.total = len(record_ids)
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.deferred = 0
+        self.skipped = 0
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'total': self.total,
+            'processed': self.processed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'deferred': self.deferred,
+            'skipped': self.skipped,
+            'rate': self.rate,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class Pacer:
+    """Spaces calls at most rate per second (0 disables)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + self.interval
+
+
+def claim_failed(record_ids, send_time=0):
+    """Switch failed records to 'sending'; returns (lease, ids actually claimed)
+
+    Records retried by another job or request in the meantime are skipped.
+    The lease covers two sends of send_time seconds and is renewed with
+    renew_claims() while the batch is sent.
+    """
+    table = SendRecord.__table__
+    lease = lease_deadline(2 * send_time)
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(record_ids), table.c.status == 'failed')
+        .values(status='sending', next_attempt_at=lease)
+        .returning(table.c.id, table.c.created_at, table.c.trigger_source, table.c.template_name)
+    ).all()
+
+    deltas = Counter()
+    for row in rows:
+        key = (row.created_at, row.trigger_source)
+        deltas[stats_key(*key, 'failed', row.template_name)] -= 1
+        deltas[stats_key(*key, 'sending', row.template_name)] += 1
+    apply_deltas(db.session.connection(), deltas)
+    db.session.commit()
+
+    return lease, [row.id for row in rows]
+
+
+def renew_claims(record_ids, lease, send_time=0):
+    """Extend the lease of records still claimed with lease; returns (new lease, ids still held)"""
+    table = SendRecord.__table__
+    renewed = lease_deadline(2 * send_time)
+    held = db.session.scalars(
+        update(table)
+        .where(table.c.id.in_(record_ids), table.c.status == 'sending', table.c.next_attempt_at == lease)
+        .values(next_attempt_at=renewed)
+        .returning(table.c.id)
+    ).all()
+    db.session.commit()
+    return renewed, set(held)
+
+
+def store_results(results, lease):
+    """Write a batch of delivery outcomes in one executemany and commit
+
+    Only records still claimed with lease are written; returns the results
+    that were stored. Results of records whose lease expired (and which
+    the sweeper may have handed to a send worker) are dropped.
+    """
+    table = SendRecord.__table__
+    # 先用一条条件更新锁定仍持有租约的记录，再逐条写结果
+    held = set(db.session.scalars(
+        update(table)
+        .where(table.c.id.in_([r['id'] for r in results]), table.c.status == 'sending',
+               table.c.next_attempt_at == lease)
+        .values(next_attempt_at=None)
+        .returning(table.c.id)
+    ).all())
+    dropped = len(results) - len(held)
+    results = [r for r in results if r['id'] in held]
+    if dropped:
+        logger.warning(f'Bulk retry lease expired on {dropped} records; their results were dropped')
+    if not results:
+        db.session.rollback()
+        return []
+
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('record_id'), table.c.status == 'sending')
+        .values(
+            status=bindparam('new_status'),
+            sent_at=bindparam('new_sent_at'),
+            duration=bindparam('new_duration'),
+            timings=bindparam('new_timings'),
+            error_msg=bindparam('new_error_msg'),
+            next_attempt_at=bindparam('new_next_attempt_at'),
+            attempts=func.coalesce(table.c.attempts, 0) + bindparam('new_attempts')
+        ),
+        [{
+            'record_id': r['id'],
+            'new_status': r['status'],
+            'new_sent_at': r['sent_at'],
+            'new_duration': r['duration'],
+            'new_timings': r['timings'],
+            'new_error_msg': r['error_msg'],
+            'new_next_attempt_at': r['next_attempt_at'],
+            'new_attempts': r['attempts']
+        } for r in results]
+    )
+
+    deltas = Counter()
+    for r in results:
+        deltas[stats_key(r['created_at'], r['trigger_source'], 'sending', r['template_name'])] -= 1
+        deltas[stats_key(r['created_at'], r['trigger_source'], r['status'], r['template_name'])] += 1
+    apply_deltas(db.session.connection(), deltas)
+    db.session.commit()
+
+    for r in results:
+        metrics.count_delivery(r['status'], r['trigger_source'], r['template_name'])
+    return results
+
+
+def outcome(record, result):
+    """Result row for store_results() from one send result"""
+    row = {
+        'id': record.id,
+        'created_at': record.created_at,
+        'trigger_source': record.trigger_source,
+        'template_name': record.template_name,
+        'status': 'failed',
+        'sent_at': record.sent_at,
+        'duration': record.duration,
+        'timings': json.dumps(result['timings']) if 'timings' in result else record.timings,
+        'error_msg': result.get('message'),
+        'next_attempt_at': None,
+        'attempts': 1
+    }
+    if result['success']:
+        row.update(status='success', sent_at=datetime.utcnow(), duration=result.get('duration'), error_msg=None)
+    elif result.get('deferred'):
+        # 所有中继熔断：与发送队列一样不计入尝试次数，交给 RetryScheduler 稍后重发
+        row.update(status='retrying', attempts=0, next_attempt_at=datetime.utcnow() + timedelta(
+            seconds=result.get('retry_after', 0) + random.uniform(1, 5)
+        ))
+    return row
+
+
+def run_job(job, sender=None):
+    """Replay job.record_ids through one MailSender, committing per batch"""
+    if sender is None:
+        sender, error = build_sender()
+        if sender is None:
+            job.state = 'failed'
+            job.error = error
+            return
+
+    job.state = 'running'
+    pacer = Pacer(job.rate)
+    # 每封邮件最长耗时（含限速间隔）；剩余租约不足一封时续租
+    send_time = sender.max_send_time() + pacer.interval
+
+    for start in range(0, job.total, job.batch_size):
+        chunk = job.record_ids[start:start + job.batch_size]
+        lease, claimed = claim_failed(chunk, send_time)
+        held = set(claimed)
+
+        # 先读完本批再结束事务，发送期间不持有数据库锁
+        records = SendRecord.query.with_entities(*RETRY_COLUMNS).filter(
+            SendRecord.id.in_(claimed)
+        ).order_by(SendRecord.id).all()
+        db.session.rollback()
+
+        results = []
+        for record in records:
+            if datetime.utcnow() + timedelta(seconds=send_time) > lease:
+                lease, held = renew_claims(list(held), lease, send_time)
+            if record.id not in held:
+                continue
+
+            pacer.wait()
+            try:
+                result = sender.send_email(
+                    recipients=json.loads(record.recipients),
+                    subject=record.subject,
+                    content=record.content,
+                    cc=json.loads(record.cc or '[]') or None,
+                    bcc=json.loads(record.bcc or '[]') or None,
+                    is_markdown=True
+                )
+            except Exception as e:
+                result = {'success': False, 'message': str(e)}
+            results.append(outcome(record, result))
+
+        stored = store_results(results, lease) if results else []
+
+        job.succeeded += sum(1 for r in stored if r['status'] == 'success')
+        job.failed += sum(1 for r in stored if r['status'] == 'failed')
+        job.deferred += sum(1 for r in stored if r['status'] == 'retrying')
+        job.skipped += len(chunk) - len(stored)
+        job.processed = start + len(chunk)
+        logger.info(f'Bulk retry {job.id}: {job.processed}/{job.total}')
+
+    job.state = 'finished'
+
+
+class BulkRetry:
+    """Runs bulk retry jobs in background threads and keeps their progress
+
+    Job progress lives in this process only; poll the process that started it.
+    """
+
+    def __init__(self, keep=50):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self.keep = keep
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['bulk_retry'] = self
+
+    def start(self, record_ids, rate=0, batch_size=100, sender=None):
+        """Create a job for record_ids and run it; returns the RetryJob"""
+        job = RetryJob(record_ids, rate=rate, batch_size=batch_size)
+        with self._lock:
+            self._jobs[job.id] = job
+            # 只保留最近的任务
+            for old in list(self._jobs)[:-self.keep]:
+                del self._jobs[old]
+
+        if self._app.config.get('TESTING'):
+            self._run(job, sender)
+        else:
+            threading.Thread(target=self._run, args=(job, sender), name=f'bulk-retry-{job.id[:8]}',
+                             daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run(self, job, sender=None):
+        with self._app.app_context():
+            try:
+                run_job(job, sender)
+            except Exception as e:
+                job.state = 'failed'
+                job.error = str(e)
+                logger.error(f'Bulk retry {job.id} failed: {str(e)}')
+            finally:
+                job.finished_at = datetime.utcnow()
+                db.session.remove()
+
+
+bulk_retry = BulkRetry()
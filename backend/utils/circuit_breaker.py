@@ -0,0 +1,121 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one relay
+
+    failure_threshold consecutive relay-level failures open the breaker.
+    While open, allow() returns False without touching the network; after
+    reset_timeout seconds one trial send is let through (half-open), and
+    its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a send may be attempted now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            # 半开状态只放行一次试探发送
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Circuit closed after successful trial send')
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_inconclusive(self):
+        """End an attempt that says nothing about the relay; frees a half-open trial"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f'Circuit opened after {self.failures} consecutive failures')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+    def retry_after(self):
+        """Seconds until an open breaker lets a trial send through (0 otherwise)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_after': round(self.retry_after(), 1)
+        }
+
+
+class CircuitBreakers:
+    """Process-wide CircuitBreaker per relay id"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, failure_threshold=None, reset_timeout=None):
+        with self._lock:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if reset_timeout is not None:
+                self.reset_timeout = reset_timeout
+            for breaker in self._breakers.values():
+                breaker.failure_threshold = self.failure_threshold
+                breaker.reset_timeout = self.reset_timeout
+
+    def get(self, relay_id):
+        breaker = self._breakers.get(relay_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    relay_id, CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                )
+        return breaker
+
+    def forget(self, relay_id):
+        with self._lock:
+            self._breakers.pop(relay_id, None)
+
+
+circuit_breakers = CircuitBreakers()
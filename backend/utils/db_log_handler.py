@@ -0,0 +1,131 @@
+import atexit
+import logging
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
+from models.database import db
+from models.models import SystemLog
+
+
+class DatabaseLogHandler(logging.Handler):
+    """Buffers WARNING+ records and writes them to system_logs in batches
+
+    emit() only renders the record and appends it to an in-memory buffer;
+    a daemon thread inserts the buffer with one executemany when it holds
+    batch_size records or every flush_interval seconds, whichever comes
+    first. When the database is unavailable the oldest buffered records
+    are dropped beyond max_buffer.
+    """
+
+    def __init__(self, level=logging.WARNING, batch_size=100, flush_interval=2, max_buffer=10000):
+        super().__init__(level)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._engine = None
+        self._thread = None
+        self.written = 0
+        self.failed_flushes = 0
+
+    def init_app(self, app):
+        """Attach to the root logger once the system_logs table exists"""
+        app.extensions['db_log_handler'] = self
+        level = app.config.get('LOG_DB_LEVEL', 'WARNING')
+        if not level or level == 'OFF':
+            return
+
+        self.setLevel(level)
+        self.batch_size = app.config.get('LOG_DB_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('LOG_DB_FLUSH_INTERVAL', self.flush_interval)
+        with app.app_context():
+            self._engine = db.engine
+
+        root = logging.getLogger()
+        if self not in root.handlers:
+            root.addHandler(self)
+
+        if not app.config.get('TESTING') and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='db-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def emit(self, record):
+        # 数据库驱动自身的日志不回写数据库，避免写入失败时循环
+        if record.name.startswith('sqlalchemy'):
+            return
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message = f'{message}\n{self._exception_text(record)}'
+            self._buffer.append({
+                'level': record.levelname,
+                'logger': record.name[:100],
+                'message': message,
+                'created_at': datetime.utcfromtimestamp(record.created)
+            })
+        except Exception:
+            self.handleError(record)
+            return
+
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        if self._thread is None:
+            self.flush()
+
+    def flush(self):
+        """Insert everything buffered so far; returns the number of rows written"""
+        if self._engine is None:
+            return 0
+
+        with self._flush_lock:
+            rows = []
+            while self._buffer:
+                try:
+                    rows.append(self._buffer.popleft())
+                except IndexError:
+                    break
+            if not rows:
+                return 0
+
+            try:
+                with self._engine.begin() as connection:
+                    connection.execute(insert(SystemLog.__table__), rows)
+            except Exception as e:
+                # 不能用 logger 报错，否则错误本身又进入缓冲区
+                self.failed_flushes += 1
+                # 放回缓冲区，空间不足时舍弃最旧的
+                room = self._buffer.maxlen - len(self._buffer)
+                if room > 0:
+                    self._buffer.extendleft(reversed(rows[-room:]))
+                sys.stderr.write(f'Failed to write {len(rows)} log records to system_logs: {e}\n')
+                return 0
+
+            self.written += len(rows)
+            return len(rows)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        super().close()
+
+    def _exception_text(self, record):
+        if not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record.exc_text
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+db_log_handler = DatabaseLogHandler()
@@ -0,0 +1,118 @@
+import threading
+import bisect
+import time
+from contextlib import contextmanager
+
+# 桶上界（毫秒），最后一个桶收集超出范围的值
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# 发送各阶段，按发生顺序
+PHASES = ('claim', 'wait', 'connect', 'tls', 'auth', 'render', 'mime', 'data', 'commit', 'total')
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of millisecond latencies"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+            self.count += 1
+            self.sum += value_ms
+            self.max = max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Estimate the q-th percentile (0-100), interpolating inside the bucket"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            largest = self.max
+        if not total:
+            return None
+
+        rank = q / 100 * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0
+                upper = self.buckets[index] if index < len(self.buckets) else largest
+                upper = min(upper, largest)
+                return round(lower + (upper - lower) * (rank - seen) / count, 2)
+            seen += count
+        return round(largest, 2)
+
+    def snapshot(self):
+        """Per-bucket counts (last one unbounded) followed by the sum"""
+        with self._lock:
+            return list(self.counts) + [self.sum]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 2) if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': round(self.max, 2) if self.count else None
+        }
+
+
+class PhaseTimer:
+    """Collects named phase durations (ms) for one send"""
+
+    def __init__(self):
+        self.timings = {}
+
+    def record(self, name, start):
+        """Add the time since start (a perf_counter() value) to phase name"""
+        elapsed = (time.perf_counter() - start) * 1000
+        self.timings[name] = round(self.timings.get(name, 0) + elapsed, 2)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+
+class LatencyStats:
+    """Per-phase send latency histograms for this process"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, phase):
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(phase, LatencyHistogram())
+        return histogram
+
+    def observe(self, phase, value_ms):
+        self.histogram(phase).observe(value_ms)
+
+    def observe_all(self, timings):
+        for phase, value_ms in timings.items():
+            self.observe(phase, value_ms)
+
+    def summary(self):
+        order = {phase: index for index, phase in enumerate(PHASES)}
+        phases = sorted(self._histograms, key=lambda p: (order.get(p, len(order)), p))
+        return {phase: self._histograms[phase].summary() for phase in phases}
+
+    def snapshot(self):
+        """{phase: LatencyHistogram.snapshot()}"""
+        return {phase: histogram.snapshot() for phase, histogram in list(self._histograms.items())}
+
+
+latency_stats = LatencyStats()
@@ -1,30 +1,174 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from flask.logging import default_handler
+
+TEXT_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+_listener = None
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full
+
+    The message and traceback are rendered on the calling thread (arguments
+    may change after the call); formatting and disk writes happen on the
+    listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, module, message[, exc]"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each call site log at most rate records per second at or below max_level
+
+    Records over the limit are dropped; the next record let through from
+    the same call site notes how many were suppressed.
+    """
+
+    def __init__(self, rate, max_level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno > self.max_level:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= 1:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+                return True
+            if site[1] < self.rate:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+def dropped_records():
+    """Records dropped because the log queue was full"""
+    handler = _queue_handler()
+    return handler.dropped if handler else 0
+
+
+def _queue_handler():
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler
+    return None
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
 
 def setup_logging(app, log_file='logs/app.log', log_level=logging.INFO):
-    """Setup application logging"""
-    
+    """Setup application logging
+
+    Every logger (the app logger and module loggers) goes through a queue
+    to a background thread that writes the rotating file and the console,
+    so request threads never wait on disk.
+    """
+    global _listener
+
+    log_level = app.config.get('LOG_LEVEL', log_level)
+
     if not os.path.exists('logs'):
         os.makedirs('logs')
-    
+
     # Create rotating file handler
-    file_handler = RotatingFileHandler(log_file, maxBytes=10485760, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-    ))
+    file_handler = RotatingFileHandler(log_file, maxBytes=10485760, backupCount=10, encoding='utf-8')
+    if app.config.get('LOG_FORMAT') == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
     file_handler.setLevel(log_level)
-    
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter(
         '[%(asctime)s] %(levelname)s: %(message)s'
     ))
     console_handler.setLevel(log_level)
-    
-    # Add handlers to app logger
-    app.logger.addHandler(file_handler)
-    app.logger.addHandler(console_handler)
+
+    # 重复调用时替换之前的队列和写线程
+    stop_logging()
+    root = logging.getLogger()
+    previous = _queue_handler()
+    if previous is not None:
+        root.removeHandler(previous)
+
+    log_queue = queue.Queue(maxsize=app.config.get('LOG_QUEUE_SIZE', 10000))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(
+        app.config.get('LOG_RATE_LIMIT', 0),
+        logging.getLevelName(app.config.get('LOG_RATE_LIMIT_LEVEL', 'DEBUG'))
+    ))
+
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    # 应用日志经 root 进入队列，不再单独挂处理器
+    root.addHandler(queue_handler)
+    root.setLevel(log_level)
+    app.logger.removeHandler(default_handler)
     app.logger.setLevel(log_level)
-    
-    return app.logger
\ No newline at end of file
+
+    return app.logger
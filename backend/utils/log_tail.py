@@ -0,0 +1,187 @@
+"""Reading the rotating app log without loading it into memory
+
+tail() reads blocks backwards from the end of app.log and continues into
+app.log.1, app.log.2, ... until it has enough entries. read_since() reads
+forward from a cursor returned by an earlier call, following the file
+across a rotation. Cursors have the form "<inode>:<offset>" and always
+point just past a complete line.
+
+Lines that do not start with the "[time] LEVEL in module:" header
+(tracebacks, multi-line messages) belong to the entry above them; with
+LOG_FORMAT=json every line is one entry.
+"""
+import json
+import os
+import re
+
+BLOCK_SIZE = 64 * 1024
+MAX_LINES = 1000
+
+HEADER_RE = re.compile(r'^\[(?P<time>[^\]]+)\] (?P<level>[A-Z]+)(?: in (?P<module>[^:]+))?: ')
+
+
+def parse_level(line):
+    """Level of a header line or JSON entry, or None for a continuation line"""
+    if line.startswith('{'):
+        try:
+            return json.loads(line).get('level')
+        except (ValueError, AttributeError):
+            return None
+    match = HEADER_RE.match(line)
+    return match.group('level') if match else None
+
+
+def rotated_files(log_file):
+    """app.log followed by its existing backups, newest first"""
+    paths = [log_file] if os.path.exists(log_file) else []
+    index = 1
+    while os.path.exists(f'{log_file}.{index}'):
+        paths.append(f'{log_file}.{index}')
+        index += 1
+    return paths
+
+
+def _decode(line):
+    return line.decode('utf-8', errors='replace').rstrip('\r')
+
+
+def _reverse_lines(f, end, block_size=BLOCK_SIZE):
+    """Yield the lines of f before offset end, last line first (bytes, no newline)"""
+    position = end
+    remainder = b''
+    while position > 0:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        lines = (f.read(step) + remainder).split(b'\n')
+        remainder = lines.pop(0)
+        yield from reversed(lines)
+    yield remainder
+
+
+def _matches(level, wanted):
+    return wanted is None or level in wanted
+
+
+def _tail_file(path, lines, wanted, entries):
+    """Prepend up to lines matching entries of path to entries; returns the cursor end"""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        reverse = _reverse_lines(f, stat.st_size)
+
+        # 最后一行可能还没写完，留给下一次 since 读取
+        partial = next(reverse, b'')
+        end = stat.st_size - len(partial)
+
+        pending = []
+        for raw in reverse:
+            if len(entries) >= lines:
+                break
+            line = _decode(raw)
+            if not line:
+                continue
+            pending.append(line)
+            level = parse_level(line)
+            if level is None:
+                continue
+            if _matches(level, wanted):
+                entries.insert(0, '\n'.join(reversed(pending)))
+            pending = []
+
+        # 文件开头没有标题行的残余内容
+        if pending and len(entries) < lines and wanted is None:
+            entries.insert(0, '\n'.join(reversed(pending)))
+
+    return f'{stat.st_ino}:{end}'
+
+
+def tail(log_file, lines=100, levels=None):
+    """Last lines entries (oldest first) whose level is in levels, and a cursor
+
+    levels None means every level. Rotated backups are read when app.log
+    alone does not hold enough matching entries.
+    """
+    lines = max(1, min(lines, MAX_LINES))
+    wanted = set(levels) if levels else None
+    entries = []
+    cursor = None
+
+    for path in rotated_files(log_file):
+        end = _tail_file(path, lines, wanted, entries)
+        cursor = cursor or end
+        if len(entries) >= lines:
+            break
+
+    return entries, cursor
+
+
+def _parse_cursor(cursor):
+    try:
+        inode, offset = cursor.split(':')
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        raise ValueError(f'Invalid log cursor: {cursor!r}')
+
+
+def _read_forward(path, offset, lines, wanted, entries):
+    """Append matching entries of path from offset; returns (stopped early, cursor)"""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        # 文件被截断时从头读
+        position = offset if offset <= stat.st_size else 0
+        f.seek(position)
+
+        current, current_level = None, None
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            line = _decode(raw[:-1])
+            level = parse_level(line)
+
+            if level is not None or current is None:
+                if current is not None and _matches(current_level, wanted):
+                    entries.append('\n'.join(current))
+                if level is not None and len(entries) >= lines:
+                    return True, f'{stat.st_ino}:{position}'
+                current, current_level = [], level
+
+            if line:
+                current.append(line)
+            position += len(raw)
+
+        if current and _matches(current_level, wanted):
+            entries.append('\n'.join(current))
+        return False, f'{stat.st_ino}:{position}'
+
+
+def read_since(log_file, cursor, lines=100, levels=None):
+    """Entries written after cursor (oldest first) and the cursor to poll with next
+
+    At most lines matching entries are returned; poll again with the new
+    cursor to read the rest. When the cursor's file has been rotated away
+    entirely, reading restarts at the oldest backup still present.
+    """
+    inode, offset = _parse_cursor(cursor)
+    lines = max(1, min(lines, MAX_LINES))
+    wanted = set(levels) if levels else None
+
+    paths = rotated_files(log_file)
+    if not paths:
+        return [], cursor
+
+    inodes = [os.stat(path).st_ino for path in paths]
+    if inode in inodes:
+        start = inodes.index(inode)
+    else:
+        start, offset = len(paths) - 1, 0
+
+    entries = []
+    new_cursor = cursor
+    # 从游标所在文件开始，按从旧到新的顺序读
+    for index in range(start, -1, -1):
+        stopped, new_cursor = _read_forward(paths[index], offset if index == start else 0,
+                                            lines, wanted, entries)
+        if stopped:
+            break
+
+    return entries, new_cursor
@@ -1,44 +1,141 @@
 import smtplib
 import logging
+import time
 from datetime import datetime
 import re
-from markdown import markdown
+from utils.smtp_pool import smtp_pool, SMTPBusyError
+from utils.rate_limit import relay_limiters
+from utils.latency import PhaseTimer, latency_stats
+from utils.template_engine import compile_text
+from utils.markdown_cache import markdown_renderer
 
 logger = logging.getLogger(__name__)
 
+# 一次发送中可能各自等满 timeout 的套接字操作：连接、STARTTLS、登录、NOOP 检查、MAIL/RCPT、DATA
+SOCKET_STEPS = 6
+
+
+def is_transient_error(error):
+    """Whether a send failure is worth retrying later
+    
+    4xx replies, dropped or timed-out connections and waits for a busy
+    relay (SMTPBusyError) are transient; 5xx
+    replies and anything else (bad addresses, encoding errors) are permanent.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, (smtplib.SMTPServerDisconnected, SMTPBusyError)):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # 连接被拒绝、超时等网络错误（smtplib 异常也是 OSError 子类，已在上面处理）
+    return isinstance(error, OSError)
+
+
+def is_relay_error(error):
+    """Whether a failure says the relay itself is unhealthy (counts toward its circuit breaker)
+    
+    Connection errors, dropped connections and 4xx replies while connecting,
+    authenticating or to MAIL FROM count. Waits on this process's own rate
+    limiter or connection pool (SMTPBusyError) and 4xx replies to RCPT TO or
+    DATA (greylisting, a full mailbox) are about this message, not the relay.
+    """
+    if isinstance(error, (SMTPBusyError, smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+        return False
+    return is_transient_error(error)
+
+
 class MailSender:
-    def __init__(self, smtp_config):
-        """Initialize mail sender with SMTP configuration"""
+    def __init__(self, smtp_config, password=None):
+        """Initialize mail sender with SMTP configuration
+        
+        password overrides smtp_config.sender_password so callers can pass the
+        decrypted value without writing it back onto the ORM object.
+        """
         self.smtp_server = smtp_config.smtp_server
         self.smtp_port = smtp_config.smtp_port
         self.sender_email = smtp_config.sender_email
-        self.sender_password = smtp_config.sender_password
+        self.sender_password = password if password is not None else smtp_config.sender_password
         self.use_tls = smtp_config.use_tls
         self.timeout = getattr(smtp_config, 'timeout', 30)
+        self.retry_times = getattr(smtp_config, 'retry_times', 0) or 0
+        self.limiter = relay_limiters.get(
+            (self.smtp_server, int(self.smtp_port), self.sender_email),
+            rate=getattr(smtp_config, 'rate_limit', 0),
+            max_concurrency=getattr(smtp_config, 'max_concurrency', 0)
+        )
+        self.pool_key = smtp_pool.make_key(
+            self.smtp_server, self.smtp_port, self.use_tls,
+            self.sender_email, self.sender_password
+        )
     
-    def test_connection(self):
-        """Test SMTP connection"""
-        try:
-            logger.info(f'Testing SMTP connection to {self.smtp_server}:{self.smtp_port}')
-            
-            # 创建SMTP连接
+    def max_send_time(self):
+        """Upper bound in seconds for one send_email() call on this relay
+        
+        Covers the limiter and pool waits plus a timeout on every socket
+        step, twice over since a dropped pooled connection is reopened once.
+        """
+        return relay_limiters.timeout + smtp_pool.acquire_timeout + 2 * SOCKET_STEPS * self.timeout
+    
+    def _connect(self, timer=None):
+        """Open and authenticate a new SMTP connection"""
+        timer = timer or PhaseTimer()
+        logger.info(f'Opening SMTP connection to {self.smtp_server}:{self.smtp_port}')
+        
+        # 创建SMTP连接（465 端口的 TLS 握手计入 connect）
+        with timer.phase('connect'):
             if self.use_tls and self.smtp_port == 465:
                 # 使用 SMTP_SSL 用于端口 465
                 server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
-            elif self.use_tls and self.smtp_port == 587:
-                # 使用 SMTP + STARTTLS 用于端口 587
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
-                server.starttls()
             else:
-                # 普通 SMTP
+                # 普通 SMTP，587 端口随后升级 STARTTLS
                 server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        
+        # 登录
+        try:
+            if self.use_tls and self.smtp_port == 587:
+                with timer.phase('tls'):
+                    server.starttls()
+            with timer.phase('auth'):
+                server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        logger.info('SMTP login successful')
+        return server
+    
+    def _with_connection(self, action, force_check=False, timer=None):
+        """Run action(server) on a pooled connection, reconnecting once if it was dropped"""
+        while True:
+            conn = smtp_pool.acquire(self.pool_key, lambda: self._connect(timer), force_check=force_check)
+            try:
+                result = action(conn.server)
+            except smtplib.SMTPServerDisconnected:
+                smtp_pool.discard(conn)
+                if conn.reused:
+                    logger.info('Pooled SMTP connection was closed by server, reconnecting')
+                    continue
+                raise
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # 服务器已拒绝本封邮件，但会话本身仍然可用
+                smtp_pool.release(conn)
+                raise
+            except Exception:
+                smtp_pool.discard(conn)
+                raise
+            smtp_pool.release(conn)
+            return result
+    
+    def test_connection(self):
+        """Test SMTP connection"""
+        try:
+            logger.info(f'Testing SMTP connection to {self.smtp_server}:{self.smtp_port}')
             
-            # 登录
-            server.login(self.sender_email, self.sender_password)
-            logger.info('SMTP login successful')
-            
-            # 关闭连接
-            server.quit()
+            # 从连接池获取连接（复用的连接会先做 NOOP 检查）
+            self._with_connection(lambda server: None, force_check=True)
             
             logger.info('SMTP connection test passed')
             return {
@@ -68,65 +165,80 @@ class MailSender:
             }
     
     def send_email(self, recipients, subject, content, cc=None, bcc=None, is_markdown=False):
-        """Send email"""
+        """Send email
+
+        The result carries duration (total ms) and timings, the per-phase
+        breakdown (wait, connect, tls, auth, render, mime, data) in ms.
+        """
+        timer = PhaseTimer()
+        started = time.perf_counter()
         try:
-            logger.info(f'Preparing to send email to {recipients}')
+            logger.debug('Preparing to send email to %s', recipients)
             
             # 转换Markdown为HTML（如果需要）
             if is_markdown:
-                content = markdown(content)
-            
-            # 创建SMTP连接
-            if self.use_tls and self.smtp_port == 465:
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
-            elif self.use_tls and self.smtp_port == 587:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
-                server.starttls()
-            else:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
-            
-            # 登录
-            server.login(self.sender_email, self.sender_password)
-            logger.info('SMTP login successful for sending')
+                with timer.phase('render'):
+                    content = markdown_renderer.render(content)
             
             # 准备邮件内容
             from email.mime.text import MIMEText
             from email.mime.multipart import MIMEMultipart
             
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = ', '.join(recipients)
+            with timer.phase('mime'):
+                msg = MIMEMultipart('alternative')
+                msg['Subject'] = subject
+                msg['From'] = self.sender_email
+                msg['To'] = ', '.join(recipients)
+                
+                if cc:
+                    msg['Cc'] = ', '.join(cc)
+                
+                # 添加文本和HTML版本
+                msg.attach(MIMEText(content, 'html' if is_markdown else 'plain'))
+                
+                all_recipients = recipients + (cc or []) + (bcc or [])
+                message = msg.as_string()
             
-            if cc:
-                msg['Cc'] = ', '.join(cc)
+            # 按中继的速率和并发限制排队，而不是被服务器以 421 拒绝
+            queued = time.perf_counter()
+            with self.limiter.slot(timeout=relay_limiters.timeout):
+                timer.record('wait', queued)
+                # 发送邮件（新建连接时 connect/tls/auth 单独计时）
+                self._with_connection(
+                    lambda server: self._send_data(server, timer, all_recipients, message),
+                    timer=timer
+                )
             
-            # 添加文本和HTML版本
-            msg.attach(MIMEText(content, 'html' if is_markdown else 'plain'))
-            
-            # 发送邮件
-            all_recipients = recipients + (cc or []) + (bcc or [])
-            server.sendmail(self.sender_email, all_recipients, msg.as_string())
-            server.quit()
-            
-            logger.info(f'Email sent successfully to {recipients}')
+            logger.debug('Email sent successfully to %s', recipients)
             return {
                 'success': True,
                 'message': f'Email sent to {len(recipients)} recipients',
                 'timestamp': datetime.utcnow().isoformat(),
-                'duration': 0
+                **self._finish_timings(timer, started)
             }
         
         except Exception as e:
             logger.error(f'Error sending email: {str(e)}')
             return {
                 'success': False,
-                'message': f'Error sending email: {str(e)}'
+                'message': f'Error sending email: {str(e)}',
+                'transient': is_transient_error(e),
+                'relay_error': is_relay_error(e),
+                **self._finish_timings(timer, started)
             }
     
+    def _send_data(self, server, timer, recipients, message):
+        with timer.phase('data'):
+            return server.sendmail(self.sender_email, recipients, message)
+    
+    @staticmethod
+    def _finish_timings(timer, started):
+        """duration / timings fields of a send result; also feeds latency_stats"""
+        total = (time.perf_counter() - started) * 1000
+        timings = dict(timer.timings, total=round(total, 2))
+        latency_stats.observe_all(timings)
+        return {'duration': int(round(total)), 'timings': timings}
+    
     def replace_variables(self, text, variables):
         """Replace variables in template"""
-        result = text
-        for key, value in variables.items():
-            result = result.replace(f'{{{{{key}}}}}', str(value))
-        return result
\ No newline at end of file
+        return compile_text(text).render(variables)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from markdown import Markdown
+
+
+class MarkdownRenderer:
+    """Markdown to HTML conversion with a bounded LRU of rendered bodies
+
+    Each thread keeps one Markdown instance and calls reset() between
+    documents instead of building a new parser for every call.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._local = threading.local()
+
+    def configure(self, max_size=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max(0, int(max_size))
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def render(self, text):
+        """Return the HTML for text, reusing a cached rendering when possible"""
+        key = hashlib.sha256(text.encode('utf-8')).digest()
+
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self._parser().reset().convert(text)
+
+        if self.max_size:
+            with self._lock:
+                self._cache[key] = html
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups > 0 else 0
+            }
+
+    def _parser(self):
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = Markdown()
+        return parser
+
+
+markdown_renderer = MarkdownRenderer()
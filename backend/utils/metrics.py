@@ -0,0 +1,222 @@
+"""In-process metrics in the Prometheus text exposition format
+
+Counters and histograms are sharded per thread: each thread only writes to
+its own dict, so recording never takes a lock and never loses increments
+between the request threads and send workers. collect() sums the shards;
+shards of finished threads are folded into a retired total so counters stay
+monotonic while short-lived request threads come and go.
+"""
+import bisect
+import threading
+import time
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils.latency import BUCKETS_MS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Sharded:
+    """Per-thread dict shards of label tuple -> value"""
+
+    # 新分片数达到该值时合并已结束线程的分片，之后阈值随存活线程数调整
+    PRUNE_MIN = 64
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._prune_at = self.PRUNE_MIN
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                # 每请求一个线程时，不依赖抓取也能回收已结束线程的分片
+                if len(self._shards) >= self._prune_at:
+                    self._fold_dead()
+                    self._prune_at = max(self.PRUNE_MIN, 2 * len(self._shards))
+        return shard
+
+    def _fold_dead(self):
+        """Merge shards of finished threads into the retired totals (lock held)"""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, value in list(shard.items()):
+                    self._merge(self._retired, key, value)
+        self._shards = live
+
+    def _merge(self, totals, key, value):
+        raise NotImplementedError
+
+    def collect(self):
+        """{labels: value} summed over every thread"""
+        with self._lock:
+            self._fold_dead()
+            live = list(self._shards)
+
+            totals = {}
+            for key, value in self._retired.items():
+                self._merge(totals, key, value)
+
+        for _, shard in live:
+            for key, value in list(shard.items()):
+                self._merge(totals, key, value)
+        return totals
+
+
+class ShardedCounter(_Sharded):
+    """Labelled counter, incremented without locking"""
+
+    def inc(self, labels=(), value=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def _merge(self, totals, key, value):
+        totals[key] = totals.get(key, 0) + value
+
+
+class ShardedHistogram(_Sharded):
+    """Labelled millisecond histogram, observed without locking
+
+    Each value is a list of per-bucket counts followed by the sum.
+    """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        super().__init__()
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value_ms):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value_ms)] += 1
+        entry[-1] += value_ms
+
+    def _merge(self, totals, key, value):
+        entry = totals.get(key)
+        if entry is None:
+            entry = totals[key] = [0] * len(value)
+        for index, item in enumerate(value):
+            entry[index] += item
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class MetricWriter:
+    """Builds one exposition document, family by family"""
+
+    def __init__(self, prefix='quicknotify'):
+        self.prefix = prefix
+        self.lines = []
+
+    def _header(self, name, kind, help_text):
+        name = f'{self.prefix}_{name}'
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        return name
+
+    def scalar(self, name, kind, help_text, samples, label_names=()):
+        """samples: {label values tuple: number}"""
+        name = self._header(name, kind, help_text)
+        for values, value in sorted(samples.items()):
+            self.lines.append(f'{name}{_labels(label_names, values)} {_number(value)}')
+
+    def histogram(self, name, help_text, samples, label_names=(), buckets=BUCKETS_MS):
+        """samples: {label values tuple: [bucket counts..., sum_ms]}; exported in seconds"""
+        name = self._header(name, 'histogram', help_text)
+        for values, entry in sorted(samples.items()):
+            running = 0
+            for bound, count in zip(tuple(buckets) + ('+Inf',), entry[:-1]):
+                running += count
+                le = bound if bound == '+Inf' else _number(bound / 1000)
+                self.lines.append(f'{name}_bucket{_labels(label_names, values, ("le", le))} {running}')
+            label_text = _labels(label_names, values)
+            self.lines.append(f'{name}_sum{label_text} {_number(entry[-1] / 1000)}')
+            self.lines.append(f'{name}_count{label_text} {running}')
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def _statement_kind(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+class Metrics:
+    """Process-wide send, HTTP and database metrics"""
+
+    def __init__(self):
+        self.deliveries = ShardedCounter()
+        self.requests = ShardedCounter()
+        self.request_latency = ShardedHistogram()
+        self.db_latency = ShardedHistogram()
+        self.started_at = time.time()
+        self._db_hooked = False
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if not self._db_hooked:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._db_hooked = True
+
+    def count_delivery(self, status, trigger_source, template_name):
+        """Count one delivery outcome (success / failed / retrying)"""
+        self.deliveries.inc((status, trigger_source or '', template_name or ''))
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # 按路由端点而不是 URL 统计，避免记录 id 等路径参数撑大标签数量
+            endpoint = request.endpoint or 'unmatched'
+            self.requests.inc((endpoint, request.method, str(response.status_code)))
+            self.request_latency.observe(
+                (endpoint, request.method), (time.perf_counter() - started) * 1000
+            )
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('metrics_started')
+        if stack:
+            self.db_latency.observe(
+                (_statement_kind(statement),), (time.perf_counter() - stack.pop()) * 1000
+            )
+
+
+metrics = Metrics()
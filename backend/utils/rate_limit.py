@@ -0,0 +1,104 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from utils.smtp_pool import SMTPBusyError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows rate acquisitions per second with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, sleeping until it is available; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RelayLimiter:
+    """Rate limit (messages/second) and concurrency cap for one relay; 0 disables either"""
+
+    def __init__(self, rate=0, max_concurrency=0):
+        self.rate = rate or 0
+        self.max_concurrency = max_concurrency or 0
+        self._bucket = TokenBucket(self.rate) if self.rate > 0 else None
+        self._slots = threading.BoundedSemaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Hold a concurrency slot and one rate token for the duration of a send
+
+        Raises SMTPBusyError when neither becomes available within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        if self._slots is not None and not self._slots.acquire(timeout=timeout):
+            raise SMTPBusyError('Timed out waiting for a free relay send slot')
+        try:
+            if self._bucket is not None:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                if not self._bucket.acquire(timeout=remaining):
+                    raise SMTPBusyError('Timed out waiting for relay rate limit')
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+
+class RelayLimiters:
+    """Process-wide RelayLimiter per relay, rebuilt when its limits change
+
+    Limits apply per process: with several worker processes each one gets
+    the full rate and concurrency, so divide the configured values accordingly.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def configure(self, timeout=None):
+        if timeout is not None:
+            self.timeout = timeout
+
+    def get(self, key, rate=0, max_concurrency=0):
+        limiter = self._limiters.get(key)
+        if limiter is not None and limiter.rate == (rate or 0) and limiter.max_concurrency == (max_concurrency or 0):
+            return limiter
+
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None or limiter.rate != (rate or 0) or limiter.max_concurrency != (max_concurrency or 0):
+                # 限制变更后新的发送使用新限流器，进行中的发送在旧对象上释放
+                limiter = RelayLimiter(rate, max_concurrency)
+                self._limiters[key] = limiter
+                logger.info(f'Relay limits for {key[0]}:{key[1]}: {rate or "unlimited"} msg/s, '
+                            f'{max_concurrency or "unlimited"} concurrent')
+            return limiter
+
+    def clear(self):
+        with self._lock:
+            self._limiters.clear()
+
+
+relay_limiters = RelayLimiters()
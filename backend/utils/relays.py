@@ -0,0 +1,161 @@
+import threading
+import time
+import logging
+from utils.mail_sender import MailSender
+from utils.circuit_breaker import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+
+class RelayHealth:
+    """Delivery counters for one relay in this process"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_used = None
+
+    def to_dict(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'outstanding': self.outstanding,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'last_used': self.last_used
+        }
+
+
+class RelayBalancer:
+    """Smooth weighted round-robin over relays, shared by every sender in the process
+
+    Each pick adds every relay's weight to its running score, takes the
+    highest score and subtracts the total weight from it, which spreads
+    picks evenly in proportion to weight. Weight 0 relays are only used as
+    failover targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores = {}
+        self._health = {}
+
+    def order(self, relays):
+        """Return relays in the order to try them: the weighted pick, then failovers"""
+        with self._lock:
+            weighted = [r for r in relays if r.weight > 0]
+            if not weighted:
+                return list(relays)
+
+            total = sum(r.weight for r in weighted)
+            for relay in weighted:
+                self._scores[relay.id] = self._scores.get(relay.id, 0) + relay.weight
+            best = max(weighted, key=lambda r: (self._scores[r.id], -r.id))
+            self._scores[best.id] -= total
+
+        rest = sorted((r for r in relays if r.id != best.id), key=lambda r: (-r.weight, r.id))
+        return [best] + rest
+
+    def begin(self, relay_id):
+        with self._lock:
+            health = self._health.setdefault(relay_id, RelayHealth())
+            health.outstanding += 1
+            health.last_used = time.time()
+
+    def end(self, relay_id, result):
+        with self._lock:
+            health = self._health.setdefault(relay_id, RelayHealth())
+            health.outstanding -= 1
+            if result['success']:
+                health.sent += 1
+                health.consecutive_failures = 0
+            else:
+                health.failed += 1
+                health.consecutive_failures += 1
+                health.last_error = result.get('message')
+
+    def health(self, relay_id):
+        with self._lock:
+            health = self._health.get(relay_id)
+            return health.to_dict() if health else RelayHealth().to_dict()
+
+    def forget(self, relay_id):
+        with self._lock:
+            self._scores.pop(relay_id, None)
+            self._health.pop(relay_id, None)
+
+
+class RelaySender:
+    """Sends each message through one of several relays, failing over on transient errors
+
+    Exposes the MailSender send_email() interface so the send queue, batch
+    and retry paths do not need to know how many relays exist. Permanent
+    errors (5xx) are returned at once since another relay would reject the
+    message as well. Only relay-level failures (see is_relay_error) count
+    toward a relay's circuit breaker; relays whose breaker is open are
+    skipped without a network round trip. When every relay is skipped the
+    result is marked deferred so the caller can reschedule without
+    counting an attempt.
+    """
+
+    def __init__(self, relays, balancer=None, breakers=None):
+        self.relays = list(relays)
+        self.balancer = balancer or relay_balancer
+        self.breakers = breakers or circuit_breakers
+        self.senders = {relay.id: MailSender(relay) for relay in self.relays}
+        self.retry_times = max(relay.retry_times for relay in self.relays)
+
+    def max_send_time(self):
+        """Upper bound in seconds for one send_email() call that fails over through every relay"""
+        return sum(sender.max_send_time() for sender in self.senders.values())
+
+    def send_email(self, *args, **kwargs):
+        failures = []
+        result = None
+
+        for relay in self.balancer.order(self.relays):
+            breaker = self.breakers.get(relay.id)
+            if not breaker.allow():
+                continue
+
+            outcome = None
+            self.balancer.begin(relay.id)
+            try:
+                outcome = self.senders[relay.id].send_email(*args, **kwargs)
+            finally:
+                self.balancer.end(relay.id, outcome or {'success': False, 'message': 'Send aborted'})
+            result = outcome
+            result['relay'] = relay.name
+
+            # 5xx 说明中继本身可用，只有临时错误计入熔断
+            if result['success'] or not result.get('transient'):
+                breaker.record_success()
+                return result
+
+            if result.get('relay_error'):
+                breaker.record_failure()
+            else:
+                # 本进程限流/连接池等待超时或收件人被暂拒，不说明中继故障
+                breaker.record_inconclusive()
+            failures.append(f'{relay.name}: {result["message"]}')
+            logger.warning(f'Relay {relay.name} failed, trying next relay: {result["message"]}')
+
+        if result is None:
+            retry_after = min(self.breakers.get(r.id).retry_after() for r in self.relays)
+            return {
+                'success': False,
+                'message': 'All SMTP relays are unavailable (circuit open)',
+                'transient': True,
+                'deferred': True,
+                'retry_after': retry_after
+            }
+
+        if len(failures) > 1:
+            result['message'] = 'All relays failed: ' + '; '.join(failures)
+        return result
+
+
+relay_balancer = RelayBalancer()
@@ -0,0 +1,220 @@
+"""Retention for send_records and system_logs
+
+Rows past the configured age or count limit are appended to gzip NDJSON
+archives partitioned by day (ARCHIVE_DIR/<table>/YYYY/MM/<table>-YYYY-MM-DD.ndjson.gz)
+and then deleted in batches with Core statements, so the send_stats_daily
+rollup keeps counting them. Each batch is written as its own gzip member and
+fsynced before its rows are deleted: a crash in between can duplicate rows
+in the archive (same id), never lose them.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, date
+from sqlalchemy import select, delete, and_, or_
+from models.database import db
+from models.models import SendRecord, SystemLog
+
+logger = logging.getLogger(__name__)
+
+# 仍在投递中或等待重试的记录不归档
+IN_FLIGHT_STATUSES = ('pending', 'sending', 'retrying')
+
+
+def archive_path(archive_dir, table_name, day):
+    return os.path.join(
+        archive_dir, table_name, f'{day:%Y}', f'{day:%m}',
+        f'{table_name}-{day.isoformat()}.ndjson.gz'
+    )
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def write_archive(archive_dir, table_name, rows):
+    """Append rows to their per-day archive files; returns the paths written"""
+    by_day = defaultdict(list)
+    for row in rows:
+        created_at = row['created_at'] or datetime.utcnow()
+        by_day[created_at.date()].append(row)
+
+    paths = []
+    for day, day_rows in sorted(by_day.items()):
+        path = archive_path(archive_dir, table_name, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        payload = ''.join(
+            json.dumps(dict(row), ensure_ascii=False, default=_json_default) + '\n'
+            for row in day_rows
+        ).encode('utf-8')
+
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                gz.write(payload)
+            raw.flush()
+            os.fsync(raw.fileno())
+        paths.append(path)
+    return paths
+
+
+def archive_rows(session, table, condition, archive_dir, batch_size=1000):
+    """Move rows matching condition into the archive, batch_size at a time
+
+    Returns the number of rows archived.
+    """
+    archived = 0
+    while True:
+        rows = session.execute(
+            select(table).where(condition).order_by(table.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        write_archive(archive_dir, table.name, rows)
+        session.execute(delete(table).where(table.c.id.in_([row['id'] for row in rows])))
+        session.commit()
+
+        archived += len(rows)
+        logger.debug(f'Archived {archived} rows from {table.name}')
+
+    return archived
+
+
+def expiry_condition(session, table, days=0, max_rows=0, now=None):
+    """Condition selecting rows older than days or beyond the newest max_rows
+
+    Returns None when neither limit is set or nothing exceeds them.
+    """
+    conditions = []
+
+    if days > 0:
+        now = now or datetime.utcnow()
+        conditions.append(table.c.created_at < now - timedelta(days=days))
+
+    if max_rows > 0:
+        boundary = session.execute(
+            select(table.c.created_at, table.c.id)
+            .order_by(table.c.created_at.desc(), table.c.id.desc())
+            .offset(max_rows)
+            .limit(1)
+        ).first()
+        if boundary is not None:
+            conditions.append(or_(
+                table.c.created_at < boundary.created_at,
+                and_(table.c.created_at == boundary.created_at, table.c.id <= boundary.id)
+            ))
+
+    if not conditions:
+        return None
+    return or_(*conditions)
+
+
+def incremental_vacuum(engine):
+    """Return free SQLite pages to the filesystem
+
+    Databases created before auto_vacuum=INCREMENTAL was set need one full
+    VACUUM to switch modes; later runs only release the freelist. Returns
+    the number of free pages released, or None on other databases.
+    """
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return None
+
+    with engine.connect() as connection:
+        freelist = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+        mode = connection.exec_driver_sql('PRAGMA auto_vacuum').scalar()
+
+        if mode != 2:
+            logger.warning('Switching SQLite database to incremental auto_vacuum (one-time full VACUUM)')
+            connection.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.exec_driver_sql('VACUUM')
+        else:
+            # pysqlite 的 execute 只推进一步（每步释放一页），executescript 会执行到结束
+            connection.connection.driver_connection.executescript('PRAGMA incremental_vacuum;')
+
+        return freelist - connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+
+
+def run_retention(config, session=None):
+    """Apply the retention settings in config once; returns a summary dict"""
+    session = session or db.session
+    archive_dir = config.get('ARCHIVE_DIR', 'archive')
+    batch_size = config.get('RETENTION_BATCH_SIZE', 1000)
+    summary = {'send_records': 0, 'system_logs': 0, 'pages_freed': None}
+
+    records = SendRecord.__table__
+    condition = expiry_condition(
+        session, records,
+        days=config.get('RECORD_RETENTION_DAYS', 0),
+        max_rows=config.get('RECORD_RETENTION_MAX', 0)
+    )
+    if condition is not None:
+        condition = and_(condition, records.c.status.notin_(IN_FLIGHT_STATUSES))
+        summary['send_records'] = archive_rows(session, records, condition, archive_dir, batch_size)
+
+    logs = SystemLog.__table__
+    condition = expiry_condition(session, logs, days=config.get('LOG_RETENTION_DAYS', 0))
+    if condition is not None:
+        summary['system_logs'] = archive_rows(session, logs, condition, archive_dir, batch_size)
+
+    session.commit()
+    if summary['send_records'] or summary['system_logs']:
+        summary['pages_freed'] = incremental_vacuum(session.get_bind())
+
+    logger.info(
+        f"Retention archived {summary['send_records']} send records and "
+        f"{summary['system_logs']} system logs"
+    )
+    return summary
+
+
+class RetentionJob:
+    """Runs run_retention every RETENTION_INTERVAL seconds in a daemon thread
+
+    Enable it in a single process only (or schedule `flask --app app retention`
+    with cron instead), otherwise several processes archive the same batch.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['retention'] = self
+
+        interval = app.config.get('RETENTION_INTERVAL', 0)
+        if app.config.get('TESTING') or interval <= 0:
+            return
+
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval,), name='retention', daemon=True
+        )
+        self._thread.start()
+        logger.info(f'Retention job scheduled every {interval}s')
+
+    def run(self):
+        with self._app.app_context():
+            try:
+                return run_retention(self._app.config)
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f'Retention job failed: {str(e)}')
+
+
+retention_job = RetentionJob()
@@ -0,0 +1,400 @@
+import queue
+import random
+import threading
+import time
+import logging
+import json
+from datetime import datetime, timedelta
+from collections import Counter
+from flask import current_app
+from sqlalchemy import update, select, or_
+from models.database import db
+from models.models import SendRecord
+from models.send_stats import apply_deltas, stats_key
+from utils.relays import RelaySender
+from utils.latency import latency_stats
+from utils.metrics import metrics
+from utils.smtp_settings import smtp_settings, SMTPSettingsError
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """Outbound mail queue backed by pending SendRecord rows
+
+    Records are committed with status='pending' before their id is queued,
+    so a restart loses nothing: init_app() re-queues every pending row.
+    Workers claim a row by switching it to 'sending' with a conditional
+    UPDATE, which keeps several processes from delivering the same record.
+    A claim is a lease: next_attempt_at holds its expiry, and claims left
+    behind by a dead worker or process are returned to 'pending' once it
+    passes (release_stale_claims). The lease covers the sender's worst-case
+    send time, and the outcome is only written while the worker still
+    holds the lease it took (store_outcome).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._workers = []
+        self._app = None
+
+    def init_app(self, app):
+        """Start worker threads and re-queue undelivered records"""
+        self._app = app
+        app.extensions['send_queue'] = self
+
+        if app.config.get('TESTING') or app.config.get('SEND_WORKERS', 0) <= 0:
+            logger.info('Send queue workers disabled')
+            return
+
+        self.recover()
+
+        for i in range(app.config['SEND_WORKERS']):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f'send-worker-{i}',
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+        logger.info(f'Send queue started with {len(self._workers)} workers')
+
+    def enqueue(self, record_id):
+        """Queue a committed pending record for delivery"""
+        self._queue.put(record_id)
+
+    def enqueue_many(self, record_ids):
+        """Queue several committed pending records for delivery"""
+        for record_id in record_ids:
+            self._queue.put(record_id)
+
+    @property
+    def running(self):
+        """Whether background workers are delivering queued records"""
+        return bool(self._workers)
+
+    def depth(self):
+        """Number of records waiting for a worker in this process"""
+        return self._queue.qsize()
+
+    def recover(self):
+        """Queue every record left in 'pending' state, including expired claims"""
+        with self._app.app_context():
+            try:
+                release_stale_claims()
+                ids = [row.id for row in SendRecord.query.with_entities(SendRecord.id)
+                       .filter(SendRecord.status == 'pending')
+                       .order_by(SendRecord.id)]
+            finally:
+                db.session.remove()
+
+        if ids:
+            logger.info(f'Recovered {len(ids)} pending records')
+            self.enqueue_many(ids)
+
+    def _worker_loop(self):
+        while True:
+            record_id = self._queue.get()
+            try:
+                with self._app.app_context():
+                    deliver_record(record_id)
+            except Exception as e:
+                logger.error(f'Error delivering record {record_id}: {str(e)}')
+            finally:
+                with self._app.app_context():
+                    db.session.remove()
+                self._queue.task_done()
+
+
+def lease_deadline(send_time=0):
+    """Expiry of a claim taken now; kept in next_attempt_at while the record is 'sending'
+
+    The lease lasts SEND_LEASE_TIMEOUT seconds, or send_time when the send
+    can take longer.
+    """
+    timeout = current_app.config.get('SEND_LEASE_TIMEOUT', 300)
+    return datetime.utcnow() + timedelta(seconds=max(timeout, send_time))
+
+
+def claim_record(record_id, statuses=('pending',), send_time=0):
+    """Atomically move a record from one of statuses to 'sending'
+
+    Returns the lease (the next_attempt_at value written) to pass to
+    store_outcome(), or None when the record could not be claimed.
+    """
+    record = db.session.query(
+        SendRecord.created_at, SendRecord.trigger_source, SendRecord.template_name, SendRecord.status
+    ).filter(SendRecord.id == record_id).first()
+    if record is None or record.status not in statuses:
+        db.session.rollback()
+        return None
+
+    lease = lease_deadline(send_time)
+    claimed = SendRecord.query.filter(
+        SendRecord.id == record_id,
+        SendRecord.status == record.status
+    ).update({'status': 'sending', 'next_attempt_at': lease}, synchronize_session=False)
+
+    if claimed == 1:
+        key = (record.created_at, record.trigger_source)
+        apply_deltas(db.session.connection(), {
+            stats_key(*key, record.status, record.template_name): -1,
+            stats_key(*key, 'sending', record.template_name): 1
+        })
+    db.session.commit()
+    return lease if claimed == 1 else None
+
+
+def store_outcome(record, lease, values):
+    """Write a send outcome onto a record claimed with lease; False if the claim was lost
+
+    The UPDATE only matches while the record is still 'sending' under this
+    lease, so a send that outlived its lease cannot overwrite the result of
+    the worker that claimed the record after it was released.
+    """
+    table = SendRecord.__table__
+    matched = db.session.execute(
+        update(table)
+        .where(table.c.id == record.id, table.c.status == 'sending', table.c.next_attempt_at == lease)
+        .values(**values)
+    ).rowcount
+    if matched != 1:
+        db.session.rollback()
+        logger.warning(f'Send claim on record {record.id} expired before its result was stored; result dropped')
+        return False
+
+    key = (record.created_at, record.trigger_source)
+    apply_deltas(db.session.connection(), {
+        stats_key(*key, 'sending', record.template_name): -1,
+        stats_key(*key, values['status'], record.template_name): 1
+    })
+    db.session.commit()
+    return True
+
+
+def release_stale_claims(now=None, limit=500):
+    """Return 'sending' records whose claim lease has expired to 'pending'; returns their ids
+
+    Covers workers, processes and bulk retry jobs that died mid-send. Claims
+    without a lease (taken before leases existed) count as expired.
+    """
+    now = now or datetime.utcnow()
+    table = SendRecord.__table__
+    expired = or_(table.c.next_attempt_at <= now, table.c.next_attempt_at.is_(None))
+
+    stale = [row.id for row in db.session.execute(
+        select(table.c.id).where(table.c.status == 'sending', expired).limit(limit)
+    )]
+    if not stale:
+        db.session.rollback()
+        return []
+
+    # 条件更新：另一进程刚续上或完成的记录不会被重置
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(stale), table.c.status == 'sending', expired)
+        .values(status='pending', next_attempt_at=None)
+        .returning(table.c.id, table.c.created_at, table.c.trigger_source, table.c.template_name)
+    ).all()
+
+    deltas = Counter()
+    for row in rows:
+        key = (row.created_at, row.trigger_source)
+        deltas[stats_key(*key, 'sending', row.template_name)] -= 1
+        deltas[stats_key(*key, 'pending', row.template_name)] += 1
+    apply_deltas(db.session.connection(), deltas)
+    db.session.commit()
+
+    if rows:
+        logger.warning(f'Released {len(rows)} records with expired send claims')
+    return [row.id for row in rows]
+
+
+def build_sender():
+    """Create a sender over the enabled relays, or return an error message"""
+    try:
+        relays = smtp_settings.get_all()
+    except SMTPSettingsError as e:
+        return None, str(e)
+
+    if not relays:
+        return None, 'SMTP not configured'
+
+    return RelaySender(relays), None
+
+
+def deliver_record(record_id, sender=None):
+    """Claim and deliver one queued record, storing the outcome on it
+
+    Pass sender to reuse one sender across many records. Returns None when
+    the record was not claimed, or the claim expired before the result
+    could be stored.
+    """
+    error = None
+    if sender is None:
+        sender, error = build_sender()
+
+    claim_started = time.perf_counter()
+    lease = claim_record(record_id, send_time=sender.max_send_time() if sender else 0)
+    if lease is None:
+        return None
+    claim_ms = round((time.perf_counter() - claim_started) * 1000, 2)
+    latency_stats.observe('claim', claim_ms)
+
+    record = SendRecord.query.get(record_id)
+
+    if sender is None:
+        result = {'success': False, 'message': error}
+    else:
+        result = sender.send_email(
+            recipients=json.loads(record.recipients),
+            subject=record.subject,
+            content=record.content,
+            cc=json.loads(record.cc or '[]') or None,
+            bcc=json.loads(record.bcc or '[]') or None,
+            is_markdown=True
+        )
+
+    attempts = record.attempts or 0
+    if not result.get('deferred'):
+        attempts += 1
+    values = {'attempts': attempts, 'next_attempt_at': None}
+    if 'timings' in result:
+        values['timings'] = json.dumps({'claim': claim_ms, **result['timings']})
+
+    if result['success']:
+        values.update(status='success', sent_at=datetime.utcnow(),
+                      duration=result.get('duration'), error_msg=None)
+    elif result.get('deferred'):
+        # 所有中继熔断：不计入尝试次数，等熔断器允许试探后再发
+        values.update(status='retrying', error_msg=result.get('message'), next_attempt_at=(
+            datetime.utcnow() + timedelta(seconds=result.get('retry_after', 0) + random.uniform(1, 5))
+        ))
+    elif result.get('transient') and attempts <= sender.retry_times:
+        # 临时错误：按指数退避安排下一次尝试，由 RetryScheduler 重新入队
+        delay = backoff_delay(
+            attempts,
+            current_app.config.get('RETRY_BACKOFF_BASE', 30),
+            current_app.config.get('RETRY_BACKOFF_MAX', 3600)
+        )
+        values.update(status='retrying', error_msg=result.get('message'),
+                      next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+    else:
+        values.update(status='failed', error_msg=result.get('message'))
+
+    result['status'] = values['status']
+    result['attempts'] = attempts
+    outcome = (values['status'], record.trigger_source, record.template_name)
+    # 提交耗时无法写进同一次提交，只计入直方图
+    commit_started = time.perf_counter()
+    stored = store_outcome(record, lease, values)
+    latency_stats.observe('commit', (time.perf_counter() - commit_started) * 1000)
+    if not stored:
+        return None
+    metrics.count_delivery(*outcome)
+
+    logger.debug('Record %s delivered (%s, attempt %s): %s',
+                 record_id, values['status'], attempts, result['message'])
+    return result
+
+
+def backoff_delay(attempt, base, cap):
+    """Seconds to wait before retry number attempt: exponential, capped, with jitter"""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    # 一半固定、一半随机，避免大量记录在同一时刻重试
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def release_due_retries(now=None, limit=500):
+    """Move due 'retrying' records back to 'pending'; returns their ids
+
+    The conditional UPDATE makes each record released by exactly one process.
+    """
+    now = now or datetime.utcnow()
+    table = SendRecord.__table__
+
+    due = [row.id for row in db.session.query(SendRecord.id).filter(
+        SendRecord.status == 'retrying',
+        SendRecord.next_attempt_at <= now
+    ).order_by(SendRecord.next_attempt_at).limit(limit)]
+    if not due:
+        db.session.rollback()
+        return []
+
+    rows = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(due), table.c.status == 'retrying')
+        .values(status='pending')
+        .returning(table.c.id, table.c.created_at, table.c.trigger_source, table.c.template_name)
+    ).all()
+
+    deltas = {}
+    for row in rows:
+        for status, delta in (('retrying', -1), ('pending', 1)):
+            key = stats_key(row.created_at, row.trigger_source, status, row.template_name)
+            deltas[key] = deltas.get(key, 0) + delta
+    apply_deltas(db.session.connection(), deltas)
+    db.session.commit()
+
+    return [row.id for row in rows]
+
+
+class RetryScheduler:
+    """Polls for records whose backoff or claim lease has expired and re-queues them
+
+    State lives in send_records (status='retrying', next_attempt_at), so
+    scheduled retries survive restarts and no thread sleeps per record.
+    """
+
+    def __init__(self, send_queue):
+        self._send_queue = send_queue
+        self._app = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['retry_scheduler'] = self
+
+        interval = app.config.get('RETRY_POLL_INTERVAL', 0)
+        if app.config.get('TESTING') or interval <= 0:
+            logger.info('Retry scheduler disabled')
+            return
+
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval,), name='retry-scheduler', daemon=True
+        )
+        self._thread.start()
+        logger.info(f'Retry scheduler polling every {interval}s')
+
+    def run_once(self):
+        """Release due retries and deliver them; returns the released ids"""
+        with self._app.app_context():
+            try:
+                ids = release_stale_claims() + release_due_retries()
+                if ids:
+                    logger.info(f'Re-queued {len(ids)} records for retry')
+                if self._send_queue.running:
+                    self._send_queue.enqueue_many(ids)
+                else:
+                    # 没有发送线程时在调度线程中直接投递
+                    for record_id in ids:
+                        deliver_record(record_id)
+                return ids
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f'Retry scheduler error: {str(e)}')
+
+
+send_queue = SendQueue()
+retry_scheduler = RetryScheduler(send_queue)
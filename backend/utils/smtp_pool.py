@@ -0,0 +1,200 @@
+import smtplib
+import threading
+import hashlib
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPBusyError(smtplib.SMTPException):
+    """No connection or send slot for the relay became free in time"""
+
+
+class PooledConnection:
+    """An authenticated SMTP connection owned by the pool"""
+
+    def __init__(self, key, server):
+        self.key = key
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+
+class SMTPConnectionPool:
+    """Process-wide pool of logged-in SMTP connections keyed by SMTP config
+
+    A reaper thread runs while any connection is idle in the pool and
+    closes those idle past idle_timeout; it exits once the pool is empty.
+    """
+
+    def __init__(self, max_size=4, idle_timeout=60, check_interval=15, acquire_timeout=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._open = {}
+        self._reaper = None
+
+    def configure(self, max_size=None, idle_timeout=None, check_interval=None, acquire_timeout=None):
+        """Update pool limits (normally called once from app config)"""
+        with self._cond:
+            if max_size is not None:
+                self.max_size = max(1, int(max_size))
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            if check_interval is not None:
+                self.check_interval = check_interval
+            if acquire_timeout is not None:
+                self.acquire_timeout = acquire_timeout
+            self._cond.notify_all()
+
+    @staticmethod
+    def make_key(smtp_server, smtp_port, use_tls, sender_email, sender_password):
+        """Build the pool key identifying one SMTP account"""
+        secret = hashlib.sha256((sender_password or '').encode()).hexdigest()
+        return (smtp_server, int(smtp_port), bool(use_tls), sender_email, secret)
+
+    def acquire(self, key, factory, force_check=False):
+        """Take an idle connection for key or open a new one with factory()"""
+        deadline = time.monotonic() + self.acquire_timeout
+        stale = []
+        conn = None
+
+        with self._cond:
+            while True:
+                stale.extend(self._prune_locked(key))
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()
+                    break
+                if self._open.get(key, 0) < self.max_size:
+                    # 预占名额，在锁外建立连接
+                    self._open[key] = self._open.get(key, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SMTPBusyError('Timed out waiting for a free SMTP connection')
+                self._cond.wait(remaining)
+
+        self._close_all(stale)
+
+        if conn is not None:
+            idle_for = time.monotonic() - conn.last_used
+            if force_check or idle_for >= self.check_interval:
+                if not self._is_alive(conn):
+                    self.discard(conn)
+                    return self.acquire(key, factory, force_check=False)
+            conn.reused = True
+            return conn
+
+        try:
+            server = factory()
+        except Exception:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(key, server)
+
+    def release(self, conn):
+        """Return a healthy connection to the pool"""
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.setdefault(conn.key, deque()).append(conn)
+            self._start_reaper()
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Drop a broken connection and free its slot"""
+        with self._cond:
+            self._open[conn.key] = max(0, self._open.get(conn.key, 0) - 1)
+            self._cond.notify()
+        self._close(conn)
+
+    def prune(self):
+        """Close every connection that has been idle past idle_timeout"""
+        with self._cond:
+            stale = []
+            for key in list(self._idle):
+                stale.extend(self._prune_locked(key))
+        self._close_all(stale)
+
+    def clear(self):
+        """Close all idle connections, e.g. after the SMTP config changed"""
+        with self._cond:
+            stale = []
+            for key, idle in self._idle.items():
+                stale.extend(idle)
+                self._open[key] = max(0, self._open.get(key, 0) - len(idle))
+                idle.clear()
+            self._cond.notify_all()
+        self._close_all(stale)
+
+    def stats(self):
+        """Return open/idle connection counts per SMTP server"""
+        with self._cond:
+            return [{
+                'server': f'{key[0]}:{key[1]}',
+                'sender_email': key[3],
+                'open': self._open.get(key, 0),
+                'idle': len(self._idle.get(key, ()))
+            } for key in self._open]
+
+    def _start_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name='smtp-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1, self.idle_timeout / 2))
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f'SMTP pool prune failed: {str(e)}')
+            with self._cond:
+                # 池中没有空闲连接时退出，下次归还连接时再启动
+                if not any(self._idle.values()):
+                    self._reaper = None
+                    return
+
+    def _prune_locked(self, key):
+        idle = self._idle.get(key)
+        if not idle:
+            return []
+        now = time.monotonic()
+        stale = [c for c in idle if now - c.last_used >= self.idle_timeout]
+        if stale:
+            self._idle[key] = deque(c for c in idle if c not in stale)
+            self._open[key] = max(0, self._open.get(key, 0) - len(stale))
+            self._cond.notify_all()
+        return stale
+
+    def _is_alive(self, conn):
+        try:
+            code, _ = conn.server.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close_all(self, conns):
+        for conn in conns:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.server.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                conn.server.close()
+            except Exception:
+                pass
+
+
+smtp_pool = SMTPConnectionPool()
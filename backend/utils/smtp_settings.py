@@ -0,0 +1,128 @@
+import threading
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+from models.models import SMTPConfig
+from utils.crypto import CryptoHandler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SMTPSettings:
+    """Immutable, decrypted snapshot of an SMTPConfig row (one relay)"""
+    id: int
+    name: str
+    smtp_server: str
+    smtp_port: int
+    use_tls: bool
+    sender_email: str
+    # 已解密的密码不出现在 repr 中，避免写入日志或异常信息
+    sender_password: str = field(repr=False)
+    timeout: int
+    retry_times: int
+    rate_limit: float
+    max_concurrency: int
+    weight: int
+    default_recipients: Optional[str]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, config, password):
+        return cls(
+            id=config.id,
+            name=config.name or f'{config.smtp_server}:{config.smtp_port}',
+            smtp_server=config.smtp_server,
+            smtp_port=config.smtp_port,
+            use_tls=config.use_tls,
+            sender_email=config.sender_email,
+            sender_password=password,
+            timeout=config.timeout or 30,
+            retry_times=config.retry_times if config.retry_times is not None else 3,
+            rate_limit=config.rate_limit or 0,
+            max_concurrency=config.max_concurrency or 0,
+            weight=config.weight if config.weight is not None else 1,
+            default_recipients=config.default_recipients,
+            updated_at=config.updated_at
+        )
+
+
+class SMTPSettingsError(Exception):
+    """Stored SMTP settings cannot be used (e.g. the password fails to decrypt)"""
+
+
+class SMTPSettingsCache:
+    """Read-through cache of the decrypted settings of every enabled relay
+
+    The send path reads the snapshot without touching the database or
+    Fernet. Config routes call invalidate() after saving; ttl bounds how
+    long other processes keep serving a stale snapshot (0 disables expiry).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = self._MISSING
+        self._loaded_at = 0
+        self._crypto = None
+
+    def configure(self, ttl=None):
+        if ttl is not None:
+            self.ttl = ttl
+
+    def get_all(self):
+        """Return a tuple of SMTPSettings for the enabled relays, ordered by id"""
+        snapshot = self._snapshot
+        if snapshot is not self._MISSING and not self._expired():
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is self._MISSING or self._expired():
+                self._snapshot = self._load()
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def get(self):
+        """Return the primary (first enabled) relay, or None when SMTP is not configured"""
+        relays = self.get_all()
+        return relays[0] if relays else None
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = self._MISSING
+
+    def _expired(self):
+        return self.ttl > 0 and time.monotonic() - self._loaded_at >= self.ttl
+
+    def _load(self):
+        configs = SMTPConfig.query.filter(
+            SMTPConfig.enabled.isnot(False)
+        ).order_by(SMTPConfig.id).all()
+        if not configs:
+            return ()
+
+        if self._crypto is None:
+            self._crypto = CryptoHandler()
+
+        relays = []
+        for config in configs:
+            try:
+                password = self._crypto.decrypt(config.sender_password)
+            except Exception as e:
+                # 单个中继密码无法解密时跳过它，其余中继照常使用
+                logger.error(f'Error decrypting password of relay {config.id}: {str(e)}')
+                continue
+            relays.append(SMTPSettings.from_model(config, password))
+
+        if not relays:
+            raise SMTPSettingsError('Error decrypting SMTP password')
+
+        logger.info(f'SMTP settings loaded: {len(relays)} relays')
+        return tuple(relays)
+
+
+smtp_settings = SMTPSettingsCache()
@@ -0,0 +1,99 @@
+import os
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+class SystemSampler:
+    """Samples system and process CPU / memory in a background thread
+
+    cpu_percent(interval=None) measures usage since the previous call, so
+    sampling on a fixed interval gives the same figure the old blocking
+    cpu_percent(interval=1) did without holding a request thread. Samples
+    are kept in a ring buffer for short history charts.
+    """
+
+    def __init__(self, interval=5, history_size=120):
+        self.interval = interval
+        self._history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._process = psutil.Process(os.getpid())
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        app.extensions['system_sampler'] = self
+        self.interval = app.config.get('STATUS_SAMPLE_INTERVAL', self.interval)
+        with self._lock:
+            self._history = deque(self._history, maxlen=app.config.get('STATUS_HISTORY_SIZE', 120))
+
+        # 建立 cpu_percent 的计算基准，首次调用总是返回 0
+        self.sample()
+        if app.config.get('TESTING') or self.interval <= 0:
+            return
+
+        self._thread = threading.Thread(target=self._loop, name='system-sampler', daemon=True)
+        self._thread.start()
+        logger.info(f'System sampler started ({self.interval}s interval)')
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample(self):
+        """Take one sample without blocking and append it to the history"""
+        memory = psutil.virtual_memory()
+        with self._process.oneshot():
+            process_memory = self._process.memory_info().rss / (1024 * 1024)
+            process_cpu = self._process.cpu_percent(interval=None)
+            threads = self._process.num_threads()
+
+        snapshot = {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory': {
+                'total': memory.total / (1024 ** 3),
+                'used': memory.used / (1024 ** 3),
+                'percent': memory.percent
+            },
+            'process': {
+                'memory_mb': process_memory,
+                'cpu_percent': process_cpu,
+                'threads': threads
+            },
+            'sampled_at': datetime.utcnow().isoformat()
+        }
+        with self._lock:
+            self._history.append(snapshot)
+        return snapshot
+
+    def latest(self):
+        """The most recent sample; sampled on demand when the thread is not running"""
+        if not self.running:
+            return self.sample()
+        with self._lock:
+            if self._history:
+                return self._history[-1]
+        return self.sample()
+
+    def history(self, limit=None):
+        """Up to limit most recent samples, oldest first"""
+        with self._lock:
+            samples = list(self._history)
+        return samples[-limit:] if limit else samples
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f'System sampling failed: {str(e)}')
+
+
+system_sampler = SystemSampler()
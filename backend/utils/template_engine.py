@@ -0,0 +1,110 @@
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+VARIABLE_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+
+class CompiledText:
+    """Template text split once into literal and {{variable}} segments"""
+
+    __slots__ = ('literals', 'names')
+
+    def __init__(self, text):
+        parts = VARIABLE_PATTERN.split(text or '')
+        # split() 交替返回 [字面量, 变量名, 字面量, ...]
+        self.literals = tuple(parts[0::2])
+        self.names = tuple(parts[1::2])
+
+    @property
+    def is_static(self):
+        return not self.names
+
+    def render(self, variables):
+        """Render in a single pass; unknown variables are left as-is"""
+        if not self.names:
+            return self.literals[0]
+
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            if name in variables:
+                out.append(str(variables[name]))
+            else:
+                out.append('{{' + name + '}}')
+            out.append(literal)
+        return ''.join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_text(text):
+    """Compile arbitrary template text (cached by the text itself)"""
+    return CompiledText(text)
+
+
+class CompiledTemplate:
+    """Compiled subject and content of one EmailTemplate version"""
+
+    def __init__(self, template):
+        self.id = template.id
+        self.name = template.name
+        self.updated_at = template.updated_at
+        self.subject = CompiledText(template.subject)
+        self.content = CompiledText(template.content)
+
+    def render(self, variables):
+        """Return the rendered (subject, content)"""
+        variables = variables or {}
+        return self.subject.render(variables), self.content.render(variables)
+
+
+class TemplateCache:
+    """Compiled templates keyed by template id and updated_at"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, template):
+        """Return the compiled form of template, compiling it on first use"""
+        with self._lock:
+            compiled = self._entries.get(template.id)
+            if compiled is not None and compiled.updated_at == template.updated_at:
+                self._entries.move_to_end(template.id)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = CompiledTemplate(template)
+
+        with self._lock:
+            self._entries[template.id] = compiled
+            self._entries.move_to_end(template.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, template_id):
+        """Drop the compiled form of one template"""
+        with self._lock:
+            self._entries.pop(template_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups > 0 else 0
+            }
+
+
+template_cache = TemplateCache()
@@ -0,0 +1,36 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Return the cached value for key, calling compute() when it is missing or stale"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -102,8 +102,8 @@ class QuickNotifyAPI {
     }
 
     // ========== 记录接口 ==========
-    listRecords(page = 1, perPage = 20, status = 'all') {
-        return this.request('GET', `/records/?page=${page}&per_page=${perPage}&status=${status}`);
+    listRecords(page = 1, perPage = 20, status = 'all', search = '') {
+        return this.request('GET', `/records/?page=${page}&per_page=${perPage}&status=${status}&search=${encodeURIComponent(search)}`);
     }
 
     getRecordStats() {
@@ -138,6 +138,8 @@ function setupEventListeners() {
                 smtp_port: parseInt(document.getElementById('smtp-port').value),
                 sender_email: document.getElementById('sender-email').value,
                 sender_password: document.getElementById('sender-password').value,
+                rate_limit: parseFloat(document.getElementById('rate-limit').value) || 0,
+                max_concurrency: parseInt(document.getElementById('max-concurrency').value) || 0,
                 use_tls: true
             };
 
@@ -532,6 +534,11 @@ async function loadSMTPConfig() {
             if (serverEl) serverEl.value = config.smtp_server;
             if (portEl) portEl.value = config.smtp_port;
             if (emailEl) emailEl.value = config.sender_email;
+            
+            const rateEl = document.getElementById('rate-limit');
+            const concurrencyEl = document.getElementById('max-concurrency');
+            if (rateEl) rateEl.value = config.rate_limit || 0;
+            if (concurrencyEl) concurrencyEl.value = config.max_concurrency || 0;
         }
     } catch (error) {
         console.log('No SMTP config found:', error);
@@ -578,8 +585,10 @@ async function loadRecords() {
     try {
         const statusFilter = document.getElementById('status-filter');
         const status = statusFilter ? statusFilter.value : 'all';
+        const searchInput = document.getElementById('record-search');
+        const search = searchInput ? searchInput.value.trim() : '';
         
-        const data = await api.listRecords(1, 20, status);
+        const data = await api.listRecords(1, 20, status, search);
         console.log('Records loaded:', data);
         
         const tbody = document.getElementById('record-tbody');
@@ -30,7 +30,10 @@ function parseEmails(text) {
 function getStatusBadge(status) {
     const statusMap = {
         'success': { text: '✅ 成功', class: 'success' },
-        'failed': { text: '❌ 失败', class: 'failed' }
+        'failed': { text: '❌ 失败', class: 'failed' },
+        'pending': { text: '⏳ 排队中', class: 'pending' },
+        'sending': { text: '📤 发送中', class: 'pending' },
+        'retrying': { text: '🔁 等待重试', class: 'pending' }
     };
     const info = statusMap[status] || { text: status, class: '' };
     return `<span class="status-badge ${info.class}">${info.text}</span>`;
@@ -60,6 +63,12 @@ function getStatusBadge(status) {
         return '<span style="color: green;">✅ 成功</span>';
     } else if (status === 'failed') {
         return '<span style="color: red;">❌ 失败</span>';
+    } else if (status === 'pending') {
+        return '<span style="color: orange;">⏳ 排队中</span>';
+    } else if (status === 'sending') {
+        return '<span style="color: orange;">📤 发送中</span>';
+    } else if (status === 'retrying') {
+        return '<span style="color: orange;">🔁 等待重试</span>';
     }
     return status;
 }
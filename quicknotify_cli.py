@@ -7,15 +7,33 @@ Usage:
     python quicknotify_cli.py template list
     python quicknotify_cli.py config test
     python quicknotify_cli.py records --status success --limit 10
+    python quicknotify_cli.py records --all
+    python quicknotify_cli.py records export --format ndjson -o records.ndjson
+    python quicknotify_cli.py records retry --start-date 2025-10-21 --rate 5
+
+Set QUICKNOTIFY_USER / QUICKNOTIFY_PASSWORD (or --user / --password) to log in
+before calling endpoints that require authentication.
 """
 
 import argparse
+import os
 import requests
 import sys
+import time
 
 class QuickNotifyCLI:
     def __init__(self, api_url='http://localhost:5000/api'):
         self.api_url = api_url
+        self.session = requests.Session()
+    
+    def login(self, username, password):
+        """Log in and keep the session cookie for later requests"""
+        url = f'{self.api_url}/auth/login'
+        response = self.session.post(url, json={'username': username, 'password': password})
+        if response.status_code != 200:
+            print(f"❌ Login failed: {response.json().get('error', response.status_code)}")
+            return False
+        return True
     
     def send_email(self, recipients, subject, content, cc=None):
         """Send email directly"""
@@ -28,7 +46,7 @@ class QuickNotifyCLI:
         }
         
         try:
-            response = requests.post(url, json=data)
+            response = self.session.post(url, json=data)
             result = response.json()
             if result.get('success'):
                 print(f"✅ {result['message']}")
@@ -45,7 +63,7 @@ class QuickNotifyCLI:
         url = f'{self.api_url}/config/smtp/test'
         
         try:
-            response = requests.post(url)
+            response = self.session.post(url)
             result = response.json()
             if result.get('success'):
                 print("✅ SMTP connection successful")
@@ -62,7 +80,7 @@ class QuickNotifyCLI:
         url = f'{self.api_url}/template/'
         
         try:
-            response = requests.get(url)
+            response = self.session.get(url)
             result = response.json()
             templates = result.get('templates', [])
             
@@ -79,29 +97,121 @@ class QuickNotifyCLI:
         except Exception as e:
             print(f"❌ Error: {str(e)}")
     
-    def get_records(self, status='all', limit=10):
-        """Get send records"""
-        url = f'{self.api_url}/records/?status={status}&per_page={limit}'
+    def iter_records(self, status='all', page_size=100):
+        """Yield every record, following next_cursor page by page"""
+        url = f'{self.api_url}/records/'
+        cursor = ''
         
-        try:
-            response = requests.get(url)
+        while cursor is not None:
+            response = self.session.get(url, params={
+                'status': status,
+                'per_page': page_size,
+                'cursor': cursor
+            })
+            response.raise_for_status()
             result = response.json()
-            records = result.get('records', [])
-            
-            if not records:
-                print("No records found")
-                return
+            yield from result.get('records', [])
+            cursor = result.get('next_cursor')
+    
+    def print_record(self, record):
+        status_icon = "✅" if record['status'] == 'success' else "❌"
+        print(f"{status_icon} {record['subject']}")
+        print(f"   To: {', '.join(record['recipients'])}")
+        print(f"   Status: {record['status']}")
+        print()
+    
+    def get_records(self, status='all', limit=10, all_pages=False):
+        """Get send records"""
+        try:
+            if all_pages:
+                records = self.iter_records(status=status, page_size=max(limit, 100))
+            else:
+                response = self.session.get(f'{self.api_url}/records/',
+                                            params={'status': status, 'per_page': limit})
+                records = response.json().get('records', [])
             
             print("\n📋 Send Records:")
             print("-" * 80)
+            count = 0
             for record in records:
-                status_icon = "✅" if record['status'] == 'success' else "❌"
-                print(f"{status_icon} {record['subject']}")
-                print(f"   To: {', '.join(record['recipients'])}")
-                print(f"   Status: {record['status']}")
-                print()
+                self.print_record(record)
+                count += 1
+            
+            if not count:
+                print("No records found")
         except Exception as e:
             print(f"❌ Error: {str(e)}")
+    
+    def export_records(self, output, export_format='csv', status='all',
+                       start_date=None, end_date=None, search=None, include_content=False):
+        """Stream /records/export straight into a file"""
+        url = f'{self.api_url}/records/export'
+        params = {'format': export_format, 'status': status}
+        if start_date:
+            params['start_date'] = start_date
+        if end_date:
+            params['end_date'] = end_date
+        if search:
+            params['search'] = search
+        if include_content:
+            params['include_content'] = 1
+        
+        try:
+            with self.session.get(url, params=params, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"❌ Export failed: {response.json().get('error', response.status_code)}")
+                    return False
+                
+                written = 0
+                with open(output, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
+                        written += len(chunk)
+            
+            print(f"✅ Exported records to {output} ({written} bytes)")
+            return True
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+            return False
+    
+    def retry_records(self, start_date=None, end_date=None, search=None, template_name=None,
+                      ids=None, limit=None, rate=None, poll_interval=2):
+        """Start a bulk retry of failed records and print progress until it ends"""
+        body = {}
+        for key, value in (('start_date', start_date), ('end_date', end_date), ('search', search),
+                           ('template_name', template_name), ('ids', ids), ('limit', limit),
+                           ('rate', rate)):
+            if value is not None:
+                body[key] = value
+        
+        try:
+            response = self.session.post(f'{self.api_url}/records/retry', json=body)
+            result = response.json()
+            if response.status_code not in (200, 202):
+                print(f"❌ Retry failed: {result.get('error')}")
+                return False
+            if response.status_code == 200:
+                print(f"ℹ️  {result.get('message')}")
+                return True
+            
+            job_id = result['job_id']
+            print(f"🔁 Retrying {result['total']} failed records (job {job_id})")
+            while result['state'] in ('queued', 'running'):
+                time.sleep(poll_interval)
+                result = self.session.get(f'{self.api_url}/records/retry/{job_id}').json()
+                print(f"   {result['processed']}/{result['total']} processed, "
+                      f"{result['succeeded']} succeeded, {result['failed']} failed")
+            
+            if result['state'] != 'finished':
+                print(f"❌ Retry job {result['state']}: {result.get('error')}")
+                return False
+            
+            print(f"✅ Retry finished: {result['succeeded']} succeeded, {result['failed']} failed, "
+                  f"{result['skipped']} skipped")
+            return True
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+            return False
 
 
 def main():
@@ -114,9 +224,17 @@ Examples:
   python quicknotify_cli.py template list
   python quicknotify_cli.py config test
   python quicknotify_cli.py records --status success --limit 10
+  python quicknotify_cli.py records --all
+  python quicknotify_cli.py records export --format ndjson -o records.ndjson
+  python quicknotify_cli.py records retry --start-date 2025-10-21 --rate 5
         """
     )
     
+    parser.add_argument('--api-url', default=os.environ.get('QUICKNOTIFY_API', 'http://localhost:5000/api'),
+                        help='QuickNotify API base URL')
+    parser.add_argument('--user', default=os.environ.get('QUICKNOTIFY_USER'), help='Login username')
+    parser.add_argument('--password', default=os.environ.get('QUICKNOTIFY_PASSWORD'), help='Login password')
+    
     subparsers = parser.add_subparsers(dest='command', help='Commands')
     
     # Send command
@@ -136,12 +254,25 @@ Examples:
     
     # Records command
     records_parser = subparsers.add_parser('records', help='Send records')
-    records_parser.add_argument('--status', choices=['all', 'success', 'failed'], default='all', help='Filter by status')
-    records_parser.add_argument('--limit', type=int, default=10, help='Number of records to show')
+    records_parser.add_argument('action', nargs='?', choices=['list', 'export', 'retry'], default='list', help='Records action')
+    records_parser.add_argument('--status', choices=['all', 'success', 'failed', 'pending', 'retrying'], default='all', help='Filter by status')
+    records_parser.add_argument('--limit', type=int, help='Number of records to show (default 10) or retry')
+    records_parser.add_argument('--all', action='store_true', help='Stream every matching record using cursor pagination')
+    records_parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv', help='Export format')
+    records_parser.add_argument('--output', '-o', help='Export file path')
+    records_parser.add_argument('--start-date', help='Only records created on or after YYYY-MM-DD')
+    records_parser.add_argument('--end-date', help='Only records created on or before YYYY-MM-DD')
+    records_parser.add_argument('--search', help='Search subject and recipients')
+    records_parser.add_argument('--include-content', action='store_true', help='Include message bodies in the export')
+    records_parser.add_argument('--template', help='Retry only records sent from this template')
+    records_parser.add_argument('--ids', help='Retry only these record ids (comma separated)')
+    records_parser.add_argument('--rate', type=float, help='Retry messages per second (server default if omitted)')
     
     args = parser.parse_args()
     
-    cli = QuickNotifyCLI()
+    cli = QuickNotifyCLI(api_url=args.api_url)
+    if args.user and args.password and not cli.login(args.user, args.password):
+        sys.exit(1)
     
     if args.command == 'send':
         recipients = [r.strip() for r in args.to.split(',')]
@@ -157,7 +288,19 @@ Examples:
             cli.list_templates()
     
     elif args.command == 'records':
-        cli.get_records(status=args.status, limit=args.limit)
+        if args.action == 'export':
+            output = args.output or f'send_records.{args.format}'
+            ok = cli.export_records(output, export_format=args.format, status=args.status,
+                                    start_date=args.start_date, end_date=args.end_date,
+                                    search=args.search, include_content=args.include_content)
+            sys.exit(0 if ok else 1)
+        if args.action == 'retry':
+            ids = [int(i) for i in args.ids.split(',')] if args.ids else None
+            ok = cli.retry_records(start_date=args.start_date, end_date=args.end_date,
+                                   search=args.search, template_name=args.template, ids=ids,
+                                   limit=args.limit, rate=args.rate)
+            sys.exit(0 if ok else 1)
+        cli.get_records(status=args.status, limit=args.limit or 10, all_pages=args.all)
     
     else:
         parser.print_help()